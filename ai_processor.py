@@ -1,2 +1,2 @@
-# This file is deprecated - AI processing is now handled by subagents using Google Gemini
-# Kept for backward compatibility
+# This file is deprecated - AI processing is now handled by subagents using Google Gemini
+# Kept for backward compatibility
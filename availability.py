@@ -0,0 +1,81 @@
+import bisect
+import math
+
+
+class BusyIntervals:
+    """Sorted, merged busy intervals answering free/busy queries in O(log n).
+    
+    Intervals are half-open [start, end). Overlapping or touching intervals
+    are merged on insert, so the start and end lists are both sorted.
+    """
+    
+    def __init__(self, intervals=()):
+        self.starts = []
+        self.ends = []
+        for start, end in sorted(intervals):
+            if start >= end:
+                continue
+            if self.ends and start <= self.ends[-1]:
+                self.ends[-1] = max(self.ends[-1], end)
+            else:
+                self.starts.append(start)
+                self.ends.append(end)
+    
+    def __len__(self):
+        return len(self.starts)
+    
+    def __iter__(self):
+        return iter(zip(self.starts, self.ends))
+    
+    def add(self, start, end):
+        """Mark [start, end) busy, merging with any interval it touches"""
+        if start >= end:
+            return
+        first = bisect.bisect_left(self.ends, start)
+        last = bisect.bisect_right(self.starts, end)
+        if first < last:
+            start = min(start, self.starts[first])
+            end = max(end, self.ends[last - 1])
+        self.starts[first:last] = [start]
+        self.ends[first:last] = [end]
+    
+    def is_free(self, start, end):
+        """True if [start, end) overlaps no busy interval"""
+        # First busy interval that ends after `start` is the only one that can overlap
+        index = bisect.bisect_right(self.ends, start)
+        return index == len(self.starts) or self.starts[index] >= end
+    
+    def free_slots(self, slots):
+        """The (start, end) slots, out of the given candidates, that are free"""
+        return [(start, end) for start, end in slots if self.is_free(start, end)]
+    
+    def free_slots_between(self, range_start, range_end, duration, step=None, limit=None):
+        """Sweep [range_start, range_end) and return free slots of `duration`.
+        
+        Slots sit on a grid of `step` (default: duration) from range_start.
+        Each busy interval is visited once, so the sweep is
+        O(log n + busy intervals in range + slots returned).
+        """
+        step = step or duration
+        slots = []
+        cursor = range_start
+        index = bisect.bisect_right(self.ends, cursor)
+        
+        while cursor + duration <= range_end:
+            gap_end = min(self.starts[index], range_end) if index < len(self.starts) else range_end
+            while cursor + duration <= gap_end:
+                slots.append((cursor, cursor + duration))
+                if limit and len(slots) >= limit:
+                    return slots
+                cursor += step
+            
+            if index >= len(self.starts):
+                break
+            
+            # Jump past the busy interval, staying on the step grid
+            busy_end = self.ends[index]
+            if cursor < busy_end:
+                cursor += step * math.ceil((busy_end - cursor) / step)
+            index = bisect.bisect_right(self.ends, cursor)
+        
+        return slots
@@ -1,79 +1,193 @@
-from datetime import datetime, timedelta
-import pytz
-
-
-class CalendarHandler:
-    def __init__(self, service):
-        self.service = service
-    
-    def create_event(self, summary, start_time, end_time, attendees=None, description=''):
-        """Create a calendar event"""
-        try:
-            event = {
-                'summary': summary,
-                'description': description,
-                'start': {
-                    'dateTime': start_time.isoformat(),
-                    'timeZone': 'UTC',
-                },
-                'end': {
-                    'dateTime': end_time.isoformat(),
-                    'timeZone': 'UTC',
-                },
-                'reminders': {
-                    'useDefault': False,
-                    'overrides': [
-                        {'method': 'email', 'minutes': 60},
-                        {'method': 'popup', 'minutes': 30},
-                    ],
-                },
-            }
-            
-            if attendees:
-                event['attendees'] = [{'email': email} for email in attendees]
-            
-            created_event = self.service.events().insert(
-                calendarId='primary',
-                body=event,
-                sendUpdates='all'
-            ).execute()
-            
-            print(f"Event created: {created_event.get('htmlLink')}")
-            return created_event
-        except Exception as e:
-            print(f"Error creating event: {e}")
-            return None
-    
-    def get_upcoming_events(self, hours=24):
-        """Get upcoming events within specified hours"""
-        try:
-            now = datetime.utcnow()
-            time_max = now + timedelta(hours=hours)
-            
-            events_result = self.service.events().list(
-                calendarId='primary',
-                timeMin=now.isoformat() + 'Z',
-                timeMax=time_max.isoformat() + 'Z',
-                singleEvents=True,
-                orderBy='startTime'
-            ).execute()
-            
-            return events_result.get('items', [])
-        except Exception as e:
-            print(f"Error fetching events: {e}")
-            return []
-    
-    def check_availability(self, start_time, end_time):
-        """Check if time slot is available"""
-        try:
-            events = self.service.events().list(
-                calendarId='primary',
-                timeMin=start_time.isoformat() + 'Z',
-                timeMax=end_time.isoformat() + 'Z',
-                singleEvents=True
-            ).execute()
-            
-            return len(events.get('items', [])) == 0
-        except Exception as e:
-            print(f"Error checking availability: {e}")
-            return False
+from datetime import datetime, timedelta, timezone
+import threading
+import time
+import pytz
+from config import AVAILABILITY_CACHE_TTL_SECONDS
+from calendar_mirror import CalendarMirror, as_utc
+from availability import BusyIntervals
+
+
+class CalendarHandler:
+    def __init__(self, service):
+        self.service = service
+        self.mirror = CalendarMirror(service)
+        self._busy_cache = {}  # (calendar id, UTC date) -> (fetched at, busy intervals that day)
+        self._busy_cache_lock = threading.Lock()
+    
+    def create_event(self, summary, start_time, end_time, attendees=None, description=''):
+        """Create a calendar event"""
+        try:
+            event = {
+                'summary': summary,
+                'description': description,
+                'start': {
+                    'dateTime': start_time.isoformat(),
+                    'timeZone': 'UTC',
+                },
+                'end': {
+                    'dateTime': end_time.isoformat(),
+                    'timeZone': 'UTC',
+                },
+                'reminders': {
+                    'useDefault': False,
+                    'overrides': [
+                        {'method': 'email', 'minutes': 60},
+                        {'method': 'popup', 'minutes': 30},
+                    ],
+                },
+            }
+            
+            if attendees:
+                event['attendees'] = [{'email': email} for email in attendees]
+            
+            created_event = self.service.events().insert(
+                calendarId='primary',
+                body=event,
+                sendUpdates='all'
+            ).execute()
+            
+            print(f"Event created: {created_event.get('htmlLink')}")
+            self.mirror.add(created_event)
+            self._invalidate_busy_cache(start_time, end_time)
+            return created_event
+        except Exception as e:
+            print(f"Error creating event: {e}")
+            return None
+    
+    def get_upcoming_events(self, hours=24):
+        """Get upcoming events within specified hours"""
+        try:
+            self.mirror.refresh()
+            return self.mirror.upcoming(hours)
+        except Exception as e:
+            print(f"Error refreshing calendar mirror, querying the API: {e}")
+        
+        try:
+            now = datetime.utcnow()
+            time_max = now + timedelta(hours=hours)
+            
+            events_result = self.service.events().list(
+                calendarId='primary',
+                timeMin=now.isoformat() + 'Z',
+                timeMax=time_max.isoformat() + 'Z',
+                singleEvents=True,
+                orderBy='startTime'
+            ).execute()
+            
+            return events_result.get('items', [])
+        except Exception as e:
+            print(f"Error fetching events: {e}")
+            return []
+    
+    def check_availability(self, start_time, end_time):
+        """Check if time slot is available"""
+        try:
+            self.mirror.refresh()
+            return self.mirror.is_free(start_time, end_time)
+        except Exception as e:
+            print(f"Error refreshing calendar mirror, querying the API: {e}")
+        
+        try:
+            events = self.service.events().list(
+                calendarId='primary',
+                timeMin=start_time.isoformat() + 'Z',
+                timeMax=end_time.isoformat() + 'Z',
+                singleEvents=True
+            ).execute()
+            
+            return len(events.get('items', [])) == 0
+        except Exception as e:
+            print(f"Error checking availability: {e}")
+            return False
+    
+    def get_busy_intervals(self, start_time, end_time, calendars=None):
+        """Busy intervals across one or more calendars from a single freebusy query"""
+        per_calendar = self._query_freebusy(start_time, end_time, calendars or ['primary'])
+        return BusyIntervals(interval for intervals in per_calendar.values() for interval in intervals)
+    
+    def _query_freebusy(self, start_time, end_time, calendars):
+        """One freebusy().query; returns {calendar id: [(start, end), ...]}"""
+        result = self.service.freebusy().query(body={
+            'timeMin': as_utc(start_time).isoformat(),
+            'timeMax': as_utc(end_time).isoformat(),
+            'items': [{'id': calendar_id} for calendar_id in calendars]
+        }).execute()
+        
+        per_calendar = {}
+        for calendar_id, info in result.get('calendars', {}).items():
+            for error in info.get('errors', []):
+                print(f"Error getting free/busy for {calendar_id}: {error.get('reason')}")
+            per_calendar[calendar_id] = [
+                (
+                    as_utc(datetime.fromisoformat(busy['start'].replace('Z', '+00:00'))),
+                    as_utc(datetime.fromisoformat(busy['end'].replace('Z', '+00:00')))
+                )
+                for busy in info.get('busy', [])
+            ]
+        
+        return per_calendar
+    
+    def get_busy_intervals_cached(self, start_time, end_time, calendars=None):
+        """Busy intervals from the per-(calendar, day) cache.
+        
+        Days that are missing or older than AVAILABILITY_CACHE_TTL_SECONDS are
+        fetched together with one freebusy query.
+        """
+        calendars = calendars or ['primary']
+        start_time, end_time = as_utc(start_time), as_utc(end_time)
+        days = self._utc_days(start_time, end_time)
+        now = time.time()
+        
+        with self._busy_cache_lock:
+            stale = [
+                (calendar_id, day) for calendar_id in calendars for day in days
+                if now - self._busy_cache.get((calendar_id, day), (0, None))[0] > AVAILABILITY_CACHE_TTL_SECONDS
+            ]
+        
+        if stale:
+            stale_calendars = sorted({calendar_id for calendar_id, _ in stale})
+            first_day = min(day for _, day in stale)
+            last_day = max(day for _, day in stale)
+            fetch_start = datetime.combine(first_day, datetime.min.time(), timezone.utc)
+            fetch_end = datetime.combine(last_day, datetime.min.time(), timezone.utc) + timedelta(days=1)
+            
+            per_day = {key: [] for key in stale}
+            per_calendar = self._query_freebusy(fetch_start, fetch_end, stale_calendars)
+            for calendar_id, busy in per_calendar.items():
+                for busy_start, busy_end in busy:
+                    # Split each interval into the UTC days it touches
+                    for day in self._utc_days(busy_start, busy_end):
+                        if (calendar_id, day) in per_day:
+                            day_start = datetime.combine(day, datetime.min.time(), timezone.utc)
+                            per_day[(calendar_id, day)].append((
+                                max(busy_start, day_start),
+                                min(busy_end, day_start + timedelta(days=1))
+                            ))
+            
+            with self._busy_cache_lock:
+                for key, intervals in per_day.items():
+                    self._busy_cache[key] = (now, intervals)
+        
+        with self._busy_cache_lock:
+            intervals = [
+                interval
+                for calendar_id in calendars for day in days
+                for interval in self._busy_cache.get((calendar_id, day), (0, []))[1]
+            ]
+        return BusyIntervals(intervals)
+    
+    def _invalidate_busy_cache(self, start_time, end_time):
+        """Drop cached free/busy for every calendar on the days an event touches"""
+        days = set(self._utc_days(as_utc(start_time), as_utc(end_time)))
+        with self._busy_cache_lock:
+            for key in [key for key in self._busy_cache if key[1] in days]:
+                del self._busy_cache[key]
+    
+    def _utc_days(self, start_time, end_time):
+        """UTC dates overlapped by [start_time, end_time)"""
+        days = []
+        day = start_time.date()
+        while datetime.combine(day, datetime.min.time(), timezone.utc) < end_time:
+            days.append(day)
+            day += timedelta(days=1)
+        return days
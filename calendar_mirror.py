@@ -0,0 +1,140 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from googleapiclient.errors import HttpError
+from config import CALENDAR_MIRROR_MAX_STALENESS_SECONDS, CALENDAR_MIRROR_LOOKBACK_DAYS
+
+
+def as_utc(dt):
+    """Treat naive datetimes as UTC (as the handlers always have) and normalize aware ones"""
+    if dt.tzinfo is None:
+        return dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc)
+
+
+def event_bounds(event):
+    """Start and end of a Calendar API event as aware UTC datetimes"""
+    bounds = []
+    for key in ('start', 'end'):
+        when = event.get(key, {})
+        if 'dateTime' in when:
+            bounds.append(as_utc(datetime.fromisoformat(when['dateTime'].replace('Z', '+00:00'))))
+        elif 'date' in when:
+            # All-day events span whole days
+            bounds.append(datetime.fromisoformat(when['date']).replace(tzinfo=timezone.utc))
+        else:
+            return None
+    return tuple(bounds)
+
+
+class CalendarMirror:
+    """Local copy of one calendar, seeded once and kept current with syncToken deltas.
+    
+    Reads refresh the mirror at most once per `max_staleness` seconds; an
+    unchanged calendar then costs a single, empty events().list call.
+    """
+    
+    def __init__(self, service, calendar_id='primary', max_staleness=CALENDAR_MIRROR_MAX_STALENESS_SECONDS,
+                 lookback_days=CALENDAR_MIRROR_LOOKBACK_DAYS):
+        self.service = service
+        self.calendar_id = calendar_id
+        self.max_staleness = max_staleness
+        self.lookback_days = lookback_days
+        self.events = {}  # event id -> event
+        self.sync_token = None
+        self.last_sync = 0
+        self.lock = threading.RLock()
+    
+    def refresh(self, force=False):
+        """Bring the mirror up to date if it is older than the staleness bound"""
+        with self.lock:
+            if not force and self.sync_token and time.time() - self.last_sync < self.max_staleness:
+                return
+            
+            if self.sync_token is None:
+                self._seed()
+            else:
+                try:
+                    self._apply_deltas()
+                except HttpError as e:
+                    if e.resp.status != 410:
+                        raise
+                    print("Calendar sync token expired, reseeding mirror...")
+                    self._seed()
+            self.last_sync = time.time()
+    
+    def upcoming(self, hours=24, now=None):
+        """Events that have not ended and start within the next `hours`, by start time"""
+        now = as_utc(now or datetime.utcnow())
+        time_max = now + timedelta(hours=hours)
+        with self.lock:
+            found = []
+            for event in self.events.values():
+                bounds = event_bounds(event)
+                if bounds and bounds[1] > now and bounds[0] < time_max:
+                    found.append((bounds[0], event))
+        return [event for _, event in sorted(found, key=lambda item: item[0])]
+    
+    def is_free(self, start_time, end_time):
+        """True if no mirrored event overlaps [start_time, end_time)"""
+        start_time, end_time = as_utc(start_time), as_utc(end_time)
+        with self.lock:
+            for event in self.events.values():
+                bounds = event_bounds(event)
+                if bounds and bounds[0] < end_time and bounds[1] > start_time:
+                    return False
+        return True
+    
+    def add(self, event):
+        """Write-through for events created by this process"""
+        with self.lock:
+            self.events[event['id']] = event
+    
+    def _seed(self):
+        """Full listing from a little before now, which also yields the first sync token"""
+        time_min = datetime.utcnow() - timedelta(days=self.lookback_days)
+        events = {}
+        page_token = None
+        
+        while True:
+            result = self.service.events().list(
+                calendarId=self.calendar_id,
+                timeMin=time_min.isoformat() + 'Z',
+                singleEvents=True,
+                maxResults=2500,
+                pageToken=page_token
+            ).execute()
+            
+            for event in result.get('items', []):
+                if event.get('status') != 'cancelled':
+                    events[event['id']] = event
+            
+            page_token = result.get('nextPageToken')
+            if not page_token:
+                self.sync_token = result.get('nextSyncToken')
+                break
+        
+        self.events = events
+    
+    def _apply_deltas(self):
+        """Apply changes since the last sync token"""
+        page_token = None
+        
+        while True:
+            result = self.service.events().list(
+                calendarId=self.calendar_id,
+                singleEvents=True,
+                syncToken=self.sync_token,
+                pageToken=page_token
+            ).execute()
+            
+            for event in result.get('items', []):
+                if event.get('status') == 'cancelled':
+                    self.events.pop(event['id'], None)
+                else:
+                    self.events[event['id']] = event
+            
+            page_token = result.get('nextPageToken')
+            if not page_token:
+                self.sync_token = result.get('nextSyncToken', self.sync_token)
+                break
@@ -1,19 +1,87 @@
-import os
-from dotenv import load_dotenv
-
-load_dotenv()
-
-# Google API settings
-SCOPES = [
-    'https://www.googleapis.com/auth/gmail.readonly',
-    'https://www.googleapis.com/auth/gmail.send',
-    'https://www.googleapis.com/auth/calendar'
-]
-
-# Google Gemini settings
-GOOGLE_API_KEY = os.getenv('GOOGLE_API_KEY')
-
-# Agent settings
-CHECK_INTERVAL_MINUTES = 5  # How often to check for new emails
-REMINDER_HOURS_BEFORE = 1    # Send reminder X hours before meeting
-MAX_EMAILS_TO_PROCESS = 10   # Max emails to process per run
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Google API settings
+SCOPES = [
+    'https://www.googleapis.com/auth/gmail.readonly',
+    'https://www.googleapis.com/auth/gmail.send',
+    'https://www.googleapis.com/auth/gmail.modify',
+    'https://www.googleapis.com/auth/calendar'
+]
+
+# Google Gemini settings
+GOOGLE_API_KEY = os.getenv('GOOGLE_API_KEY')
+
+# Agent settings
+CHECK_INTERVAL_MINUTES = 5  # How often to check for new emails
+REMINDER_HOURS_BEFORE = 1    # Send reminder X hours before meeting
+MAX_EMAILS_TO_PROCESS = 10   # Max emails to process per run
+DIGEST_FRESH_SECONDS = CHECK_INTERVAL_MINUTES * 60  # Chat serves the precomputed inbox digest as-is up to this age
+DIGEST_MAX_STALE_SECONDS = 3600                     # Older digests are summarized again while the user waits
+MEETING_EXTRACTION_TOKEN_BUDGET = 6000  # Max estimated prompt tokens of emails packed into one extraction request
+MEETING_EXTRACTION_MAX_BATCH = 10       # Max emails packed into one extraction request
+MEETING_SIGNAL_THRESHOLD = 2             # Min local meeting-signal score for an email to be sent to Gemini
+MEETING_CLASSIFIER_AUDIT_RATE = 0.05    # Share of low-scoring emails still sent to Gemini to measure recall
+
+# Gmail settings
+GMAIL_BATCH_SIZE = 50        # Max sub-requests per Gmail batch HTTP call (Gmail allows 100, recommends 50)
+GMAIL_SYNC_STATE_FILE = 'gmail_sync_state.json'  # Saved historyId cursor and unread ids
+GMAIL_SYNC_MAX_UNREAD = 100  # Max unread messages tracked by the incremental sync
+MESSAGE_STORE_PATH = os.getenv('MESSAGE_STORE_PATH', 'message_store.db')  # Local SQLite cache of parsed emails
+EMAIL_BODY_MAX_BYTES = 8192  # Stop decoding an email body once this much text is collected
+
+# Outbox settings
+OUTBOX_PATH = os.getenv('OUTBOX_PATH', MESSAGE_STORE_PATH)  # Persistent queue of outgoing emails
+OUTBOX_SENDS_PER_SECOND = 1  # Max emails the background sender sends per second
+OUTBOX_MAX_ATTEMPTS = 5      # Give up on an email after this many failed sends
+
+# Reminder settings
+REMINDER_STATE_PATH = os.getenv('REMINDER_STATE_PATH', MESSAGE_STORE_PATH)  # Reminders already fired, shared by every process so each fires once
+
+# Auto-reply settings
+REPLY_LEDGER_PATH = os.getenv('REPLY_LEDGER_PATH', MESSAGE_STORE_PATH)  # Persistent record of emails the auto-reply stage handled
+AUTO_REPLY_THREAD_COOLDOWN_HOURS = 24  # Never auto-reply to the same thread more than once in this window
+REPLY_LEDGER_RETENTION_DAYS = 90       # Ledger entries older than this are pruned at startup
+AUTO_REPLY_WORKERS = 4                 # Replies generated concurrently (Gemini calls still share the gateway's rate limit)
+AUTO_REPLY_MAX_PENDING = 8             # Max replies submitted to the workers before the next one waits
+AUTO_REPLY_MAX_ATTEMPTS = 3            # Failed replies are retried in later cycles until this many attempts
+REPLY_DRAFT_CACHE_PATH = os.getenv('REPLY_DRAFT_CACHE_PATH', MESSAGE_STORE_PATH)  # SQLite file for reusable reply drafts ('' keeps them in memory only)
+REPLY_DRAFT_SIMILARITY_THRESHOLD = 0.9  # Min cosine similarity of two masked requests for a draft to be reused
+REPLY_DRAFT_TTL_SECONDS = 7 * 86400     # Max age of a reusable draft
+REPLY_DRAFT_MAX_ENTRIES = 200           # Max drafts kept (oldest are dropped)
+
+# RAG settings
+RAG_EMBEDDING_MODEL = 'all-MiniLM-L6-v2'  # Local sentence-transformers model for RAG and intent routing
+RAG_DB_PATH = './rag_db'                  # Chroma vector store
+RAG_WARM_UP = os.getenv('RAG_WARM_UP', 'false').lower() == 'true'  # Load the model and vector store in the background at startup instead of on first use
+
+# Calendar settings
+CALENDAR_MIRROR_MAX_STALENESS_SECONDS = 60  # Max age of the local calendar mirror before a delta sync
+CALENDAR_MIRROR_LOOKBACK_DAYS = 1           # How far back the mirror is seeded
+AVAILABILITY_CACHE_TTL_SECONDS = 300       # Max age of cached per-day free/busy data
+AVAILABILITY_MAX_DAYS = 31                 # Max days one free-slot search may cover
+AVAILABILITY_MAX_SLOTS = 200               # Max free slots one search may return
+
+# Prompt compaction (quoted history, signatures and boilerplate are stripped first)
+PROMPT_SUMMARY_TOKEN_BUDGET = 1500  # Max email tokens in one summary prompt
+PROMPT_SUMMARY_EMAIL_TOKENS = 75    # Max tokens of one email preview in a summary prompt
+PROMPT_EMAIL_MAX_TOKENS = 1000      # Max tokens of one email body in a meeting-extraction prompt
+PROMPT_REPLY_EMAIL_TOKENS = 250     # Max tokens of the incoming email in an auto-reply prompt
+
+# Chat intent routing
+INTENT_ROUTER_SIMILARITY_THRESHOLD = 0.7  # Min cosine similarity to a labelled example to skip Gemini
+INTENT_ROUTER_SIMILARITY_MARGIN = 0.05    # Min lead of the best intent over the runner-up
+
+# LLM gateway settings (shared by all agents)
+LLM_REQUESTS_PER_MINUTE = 30        # Gemini requests allowed per minute across the process
+LLM_TOKENS_PER_MINUTE = 1000000     # Estimated prompt + response tokens allowed per minute
+LLM_MAX_IN_FLIGHT = 4               # Max Gemini requests running at once
+LLM_MAX_RETRIES = 3                 # Retries for rate-limit and timeout errors
+LLM_REQUEST_TIMEOUT_SECONDS = 120   # Max time a caller waits for a response, including retries
+
+# LLM response cache settings
+LLM_CACHE_PATH = os.getenv('LLM_CACHE_PATH', MESSAGE_STORE_PATH)  # SQLite file for cached responses ('' keeps them in memory only)
+LLM_CACHE_MAX_ENTRIES = 500     # Max responses kept in memory (least recently used are evicted)
+LLM_CACHE_TTL_SECONDS = 3600    # Max age of a cached response
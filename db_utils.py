@@ -0,0 +1,64 @@
+import functools
+import json
+import sqlite3
+import threading
+
+
+def open_database(path, schema, description, setup=None, memory_fallback=True):
+    """Open a SQLite database shared across threads, creating its schema.
+    
+    setup(conn) runs any start-up writes such as purging old rows. If the file
+    can't be opened or written (likely a read-only filesystem on Vercel), the data
+    lives in an in-memory database for this process, or with memory_fallback=False
+    None is returned for callers that keep their own in-memory copy.
+    """
+    try:
+        return _connect(path, schema, setup)
+    except sqlite3.Error as e:
+        if not memory_fallback:
+            print(f"Error opening {description} at {path}, keeping it in memory only: {e}")
+            return None
+        print(f"Error opening {description} at {path}, using an in-memory database: {e}")
+        return _connect(':memory:', schema, setup)
+
+
+def _connect(path, schema, setup):
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(schema)
+    if setup is not None:
+        setup(conn)
+        conn.commit()
+    return conn
+
+
+def save_state_file(path, state):
+    """Write a JSON state file; returns False if it can't be written.
+    
+    On a read-only filesystem (likely Vercel) the state then lasts only for this process.
+    """
+    try:
+        with open(path, 'w') as f:
+            json.dump(state, f)
+        return True
+    except Exception:
+        return False
+
+
+def process_singleton(factory):
+    """Decorator turning a factory function into a thread-safe getter of one process-wide instance.
+    
+    Arguments are only used by the call that creates the instance.
+    """
+    instance = None
+    lock = threading.Lock()
+    
+    @functools.wraps(factory)
+    def get(*args, **kwargs):
+        nonlocal instance
+        if instance is None:
+            with lock:
+                if instance is None:
+                    instance = factory(*args, **kwargs)
+        return instance
+    return get
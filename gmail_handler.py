@@ -1,103 +1,356 @@
-import base64
-from email.mime.text import MIMEText
-from datetime import datetime
-
-
-class GmailHandler:
-    def __init__(self, service):
-        self.service = service
-    
-    def get_unread_emails(self, max_results=10):
-        """Fetch unread emails"""
-        try:
-            results = self.service.users().messages().list(
-                userId='me',
-                q='is:unread',
-                maxResults=max_results
-            ).execute()
-            
-            messages = results.get('messages', [])
-            emails = []
-            
-            for msg in messages:
-                email_data = self.get_email_details(msg['id'])
-                emails.append(email_data)
-            
-            return emails
-        except Exception as e:
-            print(f"Error fetching emails: {e}")
-            return []
-    
-    def get_email_details(self, msg_id):
-        """Get detailed email information"""
-        try:
-            message = self.service.users().messages().get(
-                userId='me',
-                id=msg_id,
-                format='full'
-            ).execute()
-            
-            headers = message['payload']['headers']
-            subject = next((h['value'] for h in headers if h['name'] == 'Subject'), 'No Subject')
-            sender = next((h['value'] for h in headers if h['name'] == 'From'), 'Unknown')
-            date = next((h['value'] for h in headers if h['name'] == 'Date'), '')
-            
-            body = self._get_email_body(message['payload'])
-            thread_id = message.get('threadId', msg_id)
-            
-            return {
-                'id': msg_id,
-                'thread_id': thread_id,
-                'subject': subject,
-                'sender': sender,
-                'date': date,
-                'body': body
-            }
-        except Exception as e:
-            print(f"Error getting email details: {e}")
-            return None
-    
-    def _get_email_body(self, payload):
-        """Extract email body from payload"""
-        if 'parts' in payload:
-            for part in payload['parts']:
-                if part['mimeType'] == 'text/plain':
-                    data = part['body'].get('data', '')
-                    return base64.urlsafe_b64decode(data).decode('utf-8')
-        elif 'body' in payload:
-            data = payload['body'].get('data', '')
-            if data:
-                return base64.urlsafe_b64decode(data).decode('utf-8')
-        return ''
-    
-    def mark_as_read(self, msg_id):
-        """Mark email as read"""
-        try:
-            self.service.users().messages().modify(
-                userId='me',
-                id=msg_id,
-                body={'removeLabelIds': ['UNREAD']}
-            ).execute()
-        except Exception as e:
-            print(f"Error marking email as read: {e}")
-    
-    def send_email(self, to, subject, body, thread_id=None):
-        """Send an email, optionally as a reply in a thread"""
-        try:
-            message = MIMEText(body)
-            message['to'] = to
-            message['subject'] = subject
-            
-            raw = base64.urlsafe_b64encode(message.as_bytes()).decode()
-            
-            send_body = {'raw': raw}
-            if thread_id:
-                send_body['threadId'] = thread_id
-            
-            self.service.users().messages().send(
-                userId='me',
-                body=send_body
-            ).execute()
-            print(f"Email sent to {to}")
-        except Exception as e:
-            print(f"Error sending email: {e}")
+import base64
+import threading
+from email.mime.text import MIMEText
+from datetime import datetime
+from googleapiclient.discovery import build
+from config import GMAIL_BATCH_SIZE, EMAIL_BODY_MAX_BYTES
+from gmail_sync import MailboxSync
+from message_store import get_message_store
+from mime_parser import extract_text, has_part
+from outbox import get_outbox
+
+
+# Headers requested for the cheap first-phase (format='metadata') fetch
+METADATA_HEADERS = ['Subject', 'From', 'Date']
+
+# Max ids accepted by a single users().messages().batchModify call
+BATCH_MODIFY_LIMIT = 1000
+
+
+class LazyEmail(dict):
+    """Email dict whose 'body' is fetched and decoded on first access"""
+    
+    def __init__(self, data, body_loader):
+        super().__init__(data)
+        self._body_loader = body_loader
+    
+    def __missing__(self, key):
+        if key == 'body':
+            self['body'] = self._body_loader(self['id'])
+            return self['body']
+        raise KeyError(key)
+    
+    def get(self, key, default=None):
+        if key == 'body':
+            return self['body']
+        return super().get(key, default)
+    
+    @property
+    def body_loaded(self):
+        return dict.__contains__(self, 'body')
+
+
+class GmailHandler:
+    def __init__(self, service, batch_size=GMAIL_BATCH_SIZE, store=None, body_max_bytes=EMAIL_BODY_MAX_BYTES):
+        self.service = service
+        self.batch_size = batch_size
+        self.body_max_bytes = body_max_bytes
+        self.store = store if store is not None else get_message_store()
+        self.last_fetch_errors = {}
+        self._mailbox_sync = None
+        self._pending_labels = {}  # (add, remove) -> message ids
+        self._pending_lock = threading.Lock()
+        self._outbox_service = None
+        # Starts the sender for mail still queued from before a restart
+        get_outbox(self._send_queued)
+    
+    @property
+    def mailbox_sync(self):
+        """Incremental history-based sync, created on first use"""
+        if self._mailbox_sync is None:
+            self._mailbox_sync = MailboxSync(self)
+        return self._mailbox_sync
+    
+    def sync_mailbox(self):
+        """Pull mailbox changes since the last sync"""
+        return self.mailbox_sync.sync()
+    
+    def get_new_emails(self, max_results=None):
+        """Sync, then return unread emails that arrived since the previous call"""
+        self.sync_mailbox()
+        return self.mailbox_sync.take_new_emails(max_results)
+    
+    def get_unread_count(self):
+        """Number of unread emails, kept current by the incremental sync"""
+        try:
+            self.sync_mailbox()
+            return self.mailbox_sync.unread_count()
+        except Exception as e:
+            print(f"Error syncing mailbox: {e}")
+            return 0
+    
+    def get_unread_emails(self, max_results=10):
+        """Fetch unread emails"""
+        try:
+            self.sync_mailbox()
+            return self.mailbox_sync.unread_emails(max_results)
+        except Exception as e:
+            print(f"Error syncing mailbox, falling back to full query: {e}")
+        
+        try:
+            results = self.service.users().messages().list(
+                userId='me',
+                q='is:unread',
+                maxResults=max_results
+            ).execute()
+            
+            messages = results.get('messages', [])
+            emails, errors = self.fetch_email_details([msg['id'] for msg in messages])
+            self.last_fetch_errors = errors
+            
+            return emails
+        except Exception as e:
+            print(f"Error fetching emails: {e}")
+            return []
+    
+    def fetch_email_details(self, msg_ids, batch_size=None, with_body=False):
+        """Fetch many emails through Gmail batch requests.
+        
+        By default only the metadata projection is fetched and each email's
+        body is loaded on first access; pass with_body=True to fetch and
+        decode bodies up front.
+        
+        Returns (emails, errors): emails in the order of msg_ids, and a dict
+        mapping each message id that could not be fetched to its error.
+        """
+        batch_size = batch_size or self.batch_size
+        msg_ids = list(dict.fromkeys(msg_ids))  # batch request ids must be unique
+        errors = {}
+        
+        # Messages already in the local store need no network round trip
+        fetched = {
+            msg_id: self._from_store(row)
+            for msg_id, row in self.store.get_many(msg_ids).items()
+            if row['body'] is not None or not with_body
+        }
+        missing = [msg_id for msg_id in msg_ids if msg_id not in fetched]
+        
+        def on_response(request_id, response, exception):
+            if exception is not None:
+                errors[request_id] = str(exception)
+                return
+            try:
+                fetched[request_id] = self._parse_message(response, with_body=with_body)
+            except Exception as e:
+                errors[request_id] = f"Could not parse message: {e}"
+        
+        for start in range(0, len(missing), batch_size):
+            chunk = missing[start:start + batch_size]
+            batch = self.service.new_batch_http_request(callback=on_response)
+            for msg_id in chunk:
+                batch.add(self._message_request(msg_id, with_body), request_id=msg_id)
+            try:
+                batch.execute()
+            except Exception as e:
+                # The whole batch call failed - report every message that has no result
+                for msg_id in chunk:
+                    if msg_id not in fetched:
+                        errors.setdefault(msg_id, str(e))
+        
+        self.store.put_many([fetched[msg_id] for msg_id in missing if msg_id in fetched])
+        
+        for msg_id, error in errors.items():
+            print(f"Error getting email details for {msg_id}: {error}")
+        
+        emails = [fetched[msg_id] for msg_id in msg_ids if msg_id in fetched]
+        return emails, errors
+    
+    def get_email_details(self, msg_id):
+        """Get detailed email information"""
+        cached = self.store.get(msg_id)
+        if cached and cached['body'] is not None:
+            return self._from_store(cached)
+        
+        try:
+            message = self.service.users().messages().get(
+                userId='me',
+                id=msg_id,
+                format='full'
+            ).execute()
+            
+            email = self._parse_message(message, with_body=True)
+            self.store.put(email)
+            return email
+        except Exception as e:
+            print(f"Error getting email details: {e}")
+            return None
+    
+    def load_body(self, msg_id):
+        """Fetch and decode the body of one email (second hydration phase)"""
+        try:
+            message = self.service.users().messages().get(
+                userId='me',
+                id=msg_id,
+                format='full'
+            ).execute()
+            
+            body = self._get_email_body(message['payload'])
+            self.store.set_body(msg_id, body)
+            return body
+        except Exception as e:
+            print(f"Error loading email body for {msg_id}: {e}")
+            return ''
+    
+    def load_bodies(self, emails):
+        """Load the bodies of several lazy emails with batch requests"""
+        pending = [email for email in emails if isinstance(email, LazyEmail) and not email.body_loaded]
+        if not pending:
+            return
+        
+        full_emails, _ = self.fetch_email_details([email['id'] for email in pending], with_body=True)
+        loaded = {email['id']: email for email in full_emails}
+        for email in pending:
+            if email['id'] in loaded:
+                email['body'] = loaded[email['id']]['body']
+                if 'has_invite' in loaded[email['id']]:
+                    email['has_invite'] = loaded[email['id']]['has_invite']
+    
+    def _message_request(self, msg_id, with_body):
+        if with_body:
+            return self.service.users().messages().get(userId='me', id=msg_id, format='full')
+        return self.service.users().messages().get(
+            userId='me',
+            id=msg_id,
+            format='metadata',
+            metadataHeaders=METADATA_HEADERS
+        )
+    
+    def _from_store(self, row):
+        """Wrap a stored row as an email, leaving a missing body to load lazily"""
+        email = {key: value for key, value in row.items() if not (key == 'body' and value is None)}
+        return LazyEmail(email, self.load_body)
+    
+    def _parse_message(self, message, with_body=True):
+        """Convert a Gmail API message resource into an email dict"""
+        msg_id = message['id']
+        headers = message['payload']['headers']
+        subject = next((h['value'] for h in headers if h['name'] == 'Subject'), 'No Subject')
+        sender = next((h['value'] for h in headers if h['name'] == 'From'), 'Unknown')
+        date = next((h['value'] for h in headers if h['name'] == 'Date'), '')
+        thread_id = message.get('threadId', msg_id)
+        
+        email = {
+            'id': msg_id,
+            'thread_id': thread_id,
+            'subject': subject,
+            'sender': sender,
+            'date': date,
+            'snippet': message.get('snippet', '')
+        }
+        if with_body:
+            email['body'] = self._get_email_body(message['payload'])
+            email['has_invite'] = has_part(message['payload'], 'text/calendar')
+        
+        return LazyEmail(email, self.load_body)
+    
+    def _get_email_body(self, payload):
+        """Extract email body from payload"""
+        return extract_text(payload, max_bytes=self.body_max_bytes)
+    
+    def mark_as_read(self, msg_ids):
+        """Mark one email id, or a list of ids, as read"""
+        return self.modify_labels(msg_ids, remove=['UNREAD'])
+    
+    def modify_labels(self, msg_ids, add=None, remove=None):
+        """Add and remove labels on many emails with batchModify.
+        
+        Ids are sent in chunks of up to 1000 (the batchModify limit).
+        Returns True if every chunk succeeded.
+        """
+        if isinstance(msg_ids, str):
+            msg_ids = [msg_ids]
+        msg_ids = list(dict.fromkeys(msg_ids))
+        success = True
+        
+        for start in range(0, len(msg_ids), BATCH_MODIFY_LIMIT):
+            chunk = msg_ids[start:start + BATCH_MODIFY_LIMIT]
+            try:
+                self.service.users().messages().batchModify(
+                    userId='me',
+                    body={
+                        'ids': chunk,
+                        'addLabelIds': add or [],
+                        'removeLabelIds': remove or []
+                    }
+                ).execute()
+            except Exception as e:
+                print(f"Error modifying labels on {len(chunk)} email(s): {e}")
+                success = False
+        
+        return success
+    
+    def defer_mark_as_read(self, msg_ids):
+        """Queue emails to be marked as read on the next flush_label_changes()"""
+        self.defer_label_change(msg_ids, remove=['UNREAD'])
+    
+    def defer_label_change(self, msg_ids, add=None, remove=None):
+        """Queue a label change to be applied in bulk on the next flush"""
+        if isinstance(msg_ids, str):
+            msg_ids = [msg_ids]
+        key = (tuple(add or []), tuple(remove or []))
+        with self._pending_lock:
+            self._pending_labels.setdefault(key, []).extend(msg_ids)
+    
+    def flush_label_changes(self):
+        """Apply every queued label change, one batchModify call per change"""
+        with self._pending_lock:
+            pending, self._pending_labels = self._pending_labels, {}
+        
+        for (add, remove), msg_ids in pending.items():
+            self.modify_labels(msg_ids, add=list(add), remove=list(remove))
+    
+    def send_email(self, to, subject, body, thread_id=None):
+        """Send an email, optionally as a reply in a thread.
+        
+        Returns the sent message resource, or None if sending failed.
+        """
+        try:
+            sent = self._send_message(to, subject, body, thread_id)
+            print(f"Email sent to {to}")
+            return sent
+        except Exception as e:
+            print(f"Error sending email: {e}")
+            return None
+    
+    def queue_email(self, to, subject, body, thread_id=None):
+        """Queue an email for background delivery and return its outbox id"""
+        return get_outbox(self._send_queued).enqueue(to, subject, body, thread_id)
+    
+    def get_send_status(self, outbox_id):
+        """Delivery status of an email queued with queue_email"""
+        return get_outbox(self._send_queued).status(outbox_id)
+    
+    def drain_outbox(self, timeout=None):
+        """Wait for queued emails to be delivered; returns False on timeout"""
+        return get_outbox(self._send_queued).drain(timeout)
+    
+    def _send_queued(self, to, subject, body, thread_id=None):
+        """Outbox send function, run on the sender thread with its own Gmail service"""
+        return self._send_message(to, subject, body, thread_id, service=self._sender_service())
+    
+    def _sender_service(self):
+        # googleapiclient services share one httplib2 connection and are not
+        # thread-safe, so the sender thread must not use the fetch path's service
+        if self._outbox_service is None:
+            credentials = getattr(getattr(self.service, '_http', None), 'credentials', None)
+            if credentials is None:
+                return self.service
+            self._outbox_service = build('gmail', 'v1', credentials=credentials, cache_discovery=False)
+        return self._outbox_service
+    
+    def _send_message(self, to, subject, body, thread_id=None, service=None):
+        """Send an email through the Gmail API, raising on failure"""
+        message = MIMEText(body)
+        message['to'] = to
+        message['subject'] = subject
+        
+        raw = base64.urlsafe_b64encode(message.as_bytes()).decode()
+        
+        send_body = {'raw': raw}
+        if thread_id:
+            send_body['threadId'] = thread_id
+        
+        return (service or self.service).users().messages().send(
+            userId='me',
+            body=send_body
+        ).execute()
@@ -0,0 +1,195 @@
+import json
+import threading
+from googleapiclient.errors import HttpError
+from db_utils import save_state_file
+from config import GMAIL_SYNC_STATE_FILE, GMAIL_SYNC_MAX_UNREAD
+
+
+class MailboxSync:
+    """Keeps the unread set current using Gmail history deltas.
+    
+    The first sync (or a sync after the historyId cursor expires) lists
+    `is:unread` once. Every later sync asks users().history().list for the
+    changes since the saved historyId, so an unchanged mailbox costs one
+    small API call and no message downloads.
+    """
+    
+    HISTORY_TYPES = ['messageAdded', 'messageDeleted', 'labelAdded', 'labelRemoved']
+    HIDDEN_LABELS = {'SPAM', 'TRASH', 'DRAFT'}
+    
+    def __init__(self, gmail_handler, state_file=GMAIL_SYNC_STATE_FILE, max_unread=GMAIL_SYNC_MAX_UNREAD):
+        self.gmail = gmail_handler
+        self.service = gmail_handler.service
+        self.state_file = state_file
+        self.max_unread = max_unread
+        self.history_id = None
+        self.unread_ids = []       # newest first
+        self.new_ids = []          # added since the last take_new_emails()
+        self.emails = {}           # id -> hydrated email dict
+        self.lock = threading.RLock()
+        self._load_state()
+    
+    def sync(self):
+        """Apply mailbox changes since the last cursor"""
+        with self.lock:
+            if self.history_id is None:
+                return self._full_resync()
+            
+            try:
+                changes, history_id = self._fetch_history()
+            except HttpError as e:
+                if e.resp.status == 404:
+                    print("Gmail history cursor expired, running full resync...")
+                    return self._full_resync()
+                raise
+            
+            added = [msg_id for msg_id, unread in changes.items() if unread and msg_id not in self.unread_ids]
+            removed = [msg_id for msg_id, unread in changes.items() if not unread and msg_id in self.unread_ids]
+            
+            # A message that changed while still unread (e.g. relabelled) is re-hydrated
+            changed = [msg_id for msg_id, unread in changes.items() if unread and msg_id in self.unread_ids]
+            for msg_id in changed:
+                self.emails.pop(msg_id, None)
+            
+            self._apply(added, removed)
+            self.history_id = history_id
+            self._save_state()
+            
+            return {
+                'added': added + changed,
+                'removed': removed,
+                'full_resync': False
+            }
+    
+    def unread_emails(self, max_results=10):
+        """Return hydrated unread emails, newest first"""
+        with self.lock:
+            return self._hydrate(self.unread_ids[:max_results])
+    
+    def unread_count(self):
+        """Number of unread messages currently tracked"""
+        with self.lock:
+            return len(self.unread_ids)
+    
+    def take_new_emails(self, max_results=None):
+        """Return emails added since the previous call and reset the list"""
+        with self.lock:
+            self.new_ids = [msg_id for msg_id in self.new_ids if msg_id in self.unread_ids]
+            new_ids = self.new_ids if max_results is None else self.new_ids[:max_results]
+            emails = self._hydrate(new_ids)
+            
+            # Messages that failed to hydrate stay pending for the next call
+            taken = {email['id'] for email in emails}
+            self.new_ids = [msg_id for msg_id in self.new_ids if msg_id not in taken]
+            self._save_state()
+            return emails
+    
+    def _full_resync(self):
+        """Rebuild the unread set from scratch and take a fresh cursor"""
+        # Read the cursor before listing so nothing that arrives in between is lost
+        profile = self.service.users().getProfile(userId='me').execute()
+        history_id = profile['historyId']
+        
+        unread_ids = []
+        page_token = None
+        while len(unread_ids) < self.max_unread:
+            results = self.service.users().messages().list(
+                userId='me',
+                q='is:unread',
+                maxResults=min(500, self.max_unread - len(unread_ids)),
+                pageToken=page_token
+            ).execute()
+            unread_ids.extend(msg['id'] for msg in results.get('messages', []))
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                break
+        
+        added = [msg_id for msg_id in unread_ids if msg_id not in self.unread_ids]
+        removed = [msg_id for msg_id in self.unread_ids if msg_id not in unread_ids]
+        
+        self.unread_ids = unread_ids
+        self.new_ids = [msg_id for msg_id in self.new_ids if msg_id in unread_ids] + \
+            [msg_id for msg_id in added if msg_id not in self.new_ids]
+        for msg_id in removed:
+            self.emails.pop(msg_id, None)
+        self.history_id = history_id
+        self._save_state()
+        
+        return {
+            'added': added,
+            'removed': removed,
+            'full_resync': True
+        }
+    
+    def _fetch_history(self):
+        """Collect the unread state of every message touched since the cursor"""
+        changes = {}
+        history_id = self.history_id
+        page_token = None
+        
+        while True:
+            results = self.service.users().history().list(
+                userId='me',
+                startHistoryId=self.history_id,
+                historyTypes=self.HISTORY_TYPES,
+                pageToken=page_token
+            ).execute()
+            
+            for record in results.get('history', []):
+                for item in record.get('messagesAdded', []):
+                    changes[item['message']['id']] = self._is_unread(item['message'])
+                for key in ('labelsAdded', 'labelsRemoved'):
+                    for item in record.get(key, []):
+                        changes[item['message']['id']] = self._is_unread(item['message'])
+                for item in record.get('messagesDeleted', []):
+                    changes[item['message']['id']] = False
+            
+            history_id = results.get('historyId', history_id)
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                break
+        
+        return changes, history_id
+    
+    def _is_unread(self, message):
+        labels = set(message.get('labelIds', []))
+        return 'UNREAD' in labels and not labels & self.HIDDEN_LABELS
+    
+    def _apply(self, added, removed):
+        removed = set(removed)
+        self.unread_ids = [msg_id for msg_id in reversed(added)] + \
+            [msg_id for msg_id in self.unread_ids if msg_id not in removed]
+        self.unread_ids = self.unread_ids[:self.max_unread]
+        self.new_ids = [msg_id for msg_id in self.new_ids if msg_id not in removed] + \
+            [msg_id for msg_id in added if msg_id not in self.new_ids]
+        for msg_id in removed:
+            self.emails.pop(msg_id, None)
+    
+    def _hydrate(self, msg_ids):
+        """Fetch details for ids that are not cached yet, in one batch"""
+        missing = [msg_id for msg_id in msg_ids if msg_id not in self.emails]
+        if missing:
+            emails, errors = self.gmail.fetch_email_details(missing)
+            self.gmail.last_fetch_errors = errors
+            for email in emails:
+                self.emails[email['id']] = email
+        return [self.emails[msg_id] for msg_id in msg_ids if msg_id in self.emails]
+    
+    def _load_state(self):
+        try:
+            with open(self.state_file, 'r') as f:
+                state = json.load(f)
+            self.history_id = state.get('history_id')
+            self.unread_ids = state.get('unread_ids', [])
+            self.new_ids = state.get('new_ids', [])
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Error loading Gmail sync state, starting fresh: {e}")
+    
+    def _save_state(self):
+        save_state_file(self.state_file, {
+            'history_id': self.history_id,
+            'unread_ids': self.unread_ids,
+            'new_ids': self.new_ids
+        })
@@ -0,0 +1,197 @@
+import re
+import threading
+import time
+from config import INTENT_ROUTER_SIMILARITY_THRESHOLD, INTENT_ROUTER_SIMILARITY_MARGIN
+from rag_resources import get_rag_resources
+
+
+# Requests that need parameters extracted (recipients, dates, titles) always go to Gemini
+NEEDS_PARAMETERS = re.compile(
+    r"\b(?:send|reply|respond|write|compose|draft|forward|email (?:to|him|her|them)|book|set up|setup"
+    r"|create|add|cancel|move|reschedule|invite|remind me|schedule (?:a|an|the|my|me)|at \d"
+    r"|clear|block|delete|remove|free up)"
+    r"|@|\b\d{1,2}(?::\d{2})?\s*(?:am|pm)\b"
+    # Dates and ranges only Gemini can turn into parameters
+    r"|\b(?:mon|tues|wednes|thurs|fri|satur|sun)days?\b"
+    r"|\b(?:january|february|march|april|june|july|august|september|october|november|december|may \d)"
+    r"|\b\d+\s+(?:days?|weeks?|months?)\b|\b(?:this|next|last) (?:month|year|weekend)\b"
+    r"|\b\d{1,2}(?:st|nd|rd|th)\b|\b\d{1,2}/\d{1,2}\b",
+    re.IGNORECASE
+)
+
+# (pattern, intent) pairs tried in order; each intent has every parameter its handler needs
+GRAMMAR = [
+    (re.compile(
+        r"^\W*(?:hi|hello|hey|yo|hiya|thanks|thank you|thx|good (?:morning|afternoon|evening)|how are you)"
+        r"(?:\s+(?:carlo|there|so much|a lot))?\W*$",
+        re.IGNORECASE
+    ), 'greeting'),
+    (re.compile(
+        r"\b(?:check|read|summari[sz]e|show(?: me)?|list|go through|catch me up on)\s+(?:my\s+|the\s+)?"
+        r"(?:new\s+|unread\s+|latest\s+|recent\s+)?(?:e-?mails?|inbox|mail|messages)(?:\s+(?:today|now|please))?\W*$"
+        r"|\b(?:summary of|what'?s (?:in|new in))\s+my\s+(?:e-?mails?|inbox|mail)\b"
+        r"|\b(?:any|do i have(?: any)?)\s+(?:new|unread)\s+(?:e-?mails?|mail|messages)\b"
+        r"|^\W*(?:my\s+)?(?:e-?mails?|inbox|mail)\W*$",
+        re.IGNORECASE
+    ), 'summarize_email'),
+    # Only possessive or time-scoped questions: "what's the plan for the launch?" is not a calendar check
+    (re.compile(
+        r"\b(?:what'?s|what is|show(?: me)?|check|list|anything)\s+(?:on\s+|in\s+)?my\s+(?:calendar|schedule|agenda)\b"
+        r"|\bmy\s+(?:calendar|schedule|agenda)\s+(?:for\s+)?(?:today|tonight|tomorrow|this week|next week)\b"
+        r"|\b(?:do i have|have i got|what do i have)(?:\s+any)?(?:\s+(?:meetings?|events?|plans))?"
+        r"\s+(?:on\s+)?(?:today|tonight|tomorrow|this week|next week)\W*$"
+        r"|\bmy\s+(?:next|upcoming)\s+(?:meetings?|events?)\b"
+        r"|^\W*(?:my\s+)?(?:calendar|agenda|schedule)\W*$",
+        re.IGNORECASE
+    ), 'check_calendar'),
+]
+
+# Labelled examples for the embedding nearest-neighbour fallback
+EXAMPLES = {
+    'greeting': [
+        "hi", "hello there", "hey carlo", "good morning", "thanks a lot", "how are you doing"
+    ],
+    'summarize_email': [
+        "check my email", "summarize my inbox", "do I have any new emails",
+        "what did people send me", "catch me up on my mail", "anything important in my inbox"
+    ],
+    'check_calendar': [
+        "what's on my calendar", "do I have any meetings today", "show my schedule",
+        "what's coming up", "am I busy tomorrow", "what's next on my agenda"
+    ],
+}
+
+INTENTS = {
+    'greeting': {
+        'type': 'conversation',
+        'agent': 'none',
+        'action': 'none',
+        'conversational_response': "Hi! I can summarize your emails, check your calendar or schedule meetings. What would you like to do?",
+        'parameters': {}
+    },
+    'summarize_email': {
+        'type': 'task',
+        'agent': 'EmailAgent',
+        'action': 'summarize',
+        'conversational_response': "Let me check your inbox!",
+        'parameters': {}
+    },
+    'check_calendar': {
+        'type': 'task',
+        'agent': 'CalendarAgent',
+        'action': 'check_upcoming',
+        'conversational_response': "Let me look at your calendar!",
+        'parameters': {}
+    },
+}
+
+# Look-ahead windows for calendar checks, first match wins
+CALENDAR_HORIZONS = [
+    (re.compile(r"\bnext (\d{1,3}) hours?\b", re.IGNORECASE), None),
+    (re.compile(r"\bthis week\b", re.IGNORECASE), 168),
+    (re.compile(r"\btomorrow\b", re.IGNORECASE), 48),
+    (re.compile(r"\b(?:today|tonight)\b", re.IGNORECASE), 24),
+]
+
+# Any time scope; a calendar check naming one that CALENDAR_HORIZONS can't parse goes to
+# Gemini rather than silently becoming the 24-hour default
+TIME_SCOPE = re.compile(
+    r"\b(?:today|tonight|tomorrow|yesterday|morning|afternoon|evening|weekend|hours?|days?|weeks?|months?|years?)\b",
+    re.IGNORECASE
+)
+
+
+class IntentRouter:
+    """Local intent classifier that answers common chat commands without a Gemini call.
+    
+    A regex grammar is tried first, then, when an embedding model is available, the
+    nearest labelled example. Without an explicit model the shared RAG model is used,
+    but only once something else has loaded it - routing never waits for a model
+    load. route() returns None for anything ambiguous or that needs parameters,
+    which the coordinator then sends to Gemini.
+    """
+    
+    def __init__(self, embedding_model=None, threshold=INTENT_ROUTER_SIMILARITY_THRESHOLD,
+                 margin=INTENT_ROUTER_SIMILARITY_MARGIN):
+        self.embedding_model = embedding_model
+        self.threshold = threshold
+        self.margin = margin
+        self._examples = None
+        self._examples_lock = threading.Lock()
+        self.stats = {'grammar': 0, 'embedding': 0, 'fallthrough': 0}
+    
+    def route(self, command):
+        """Intent dict shaped like Gemini's classification, or None to fall through"""
+        started = time.perf_counter()
+        label, method = self._classify(command)
+        parameters = self._parameters(label, command) if label is not None else None
+        if label is not None and parameters is None:
+            label, method = None, 'unrecognised time scope'
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        
+        if label is None:
+            self.stats['fallthrough'] += 1
+            print(f"[IntentRouter] '{command}' -> Gemini ({method}, {elapsed_ms:.1f}ms)")
+            return None
+        
+        self.stats[method] += 1
+        intent = dict(INTENTS[label])
+        intent['parameters'] = parameters
+        print(f"[IntentRouter] '{command}' -> {intent['agent']}/{intent['action']} ({method}, {elapsed_ms:.1f}ms)")
+        return intent
+    
+    def _classify(self, command):
+        if NEEDS_PARAMETERS.search(command):
+            return None, 'needs parameters'
+        
+        matches = {label for pattern, label in GRAMMAR if pattern.search(command)}
+        if len(matches) == 1:
+            return matches.pop(), 'grammar'
+        if len(matches) > 1:
+            return None, 'ambiguous grammar match'
+        
+        # The web app only loads the shared model when RAG_WARM_UP is set or RAG is
+        # first used; until then anything the grammar doesn't match goes to Gemini
+        embedding_model = self.embedding_model or get_rag_resources().loaded_embedding_model()
+        if embedding_model is None:
+            return None, 'no grammar match, embedding model not loaded'
+        return self._nearest_example(command, embedding_model)
+    
+    def _nearest_example(self, command, embedding_model):
+        labels, vectors = self._example_vectors(embedding_model)
+        query = embedding_model.encode([command], convert_to_numpy=True, normalize_embeddings=True)[0]
+        similarities = vectors @ query
+        
+        best = {}
+        for label, similarity in zip(labels, similarities):
+            best[label] = max(best.get(label, -1.0), float(similarity))
+        ranked = sorted(best.items(), key=lambda item: item[1], reverse=True)
+        label, similarity = ranked[0]
+        runner_up = ranked[1][1] if len(ranked) > 1 else -1.0
+        
+        if similarity < self.threshold or similarity - runner_up < self.margin:
+            return None, f"low similarity {similarity:.2f}"
+        return label, 'embedding'
+    
+    def _example_vectors(self, embedding_model):
+        # Examples are embedded once, on first use
+        if self._examples is None:
+            with self._examples_lock:
+                if self._examples is None:
+                    labels = [label for label, texts in EXAMPLES.items() for _ in texts]
+                    texts = [text for texts in EXAMPLES.values() for text in texts]
+                    vectors = embedding_model.encode(texts, convert_to_numpy=True, normalize_embeddings=True)
+                    self._examples = (labels, vectors)
+        return self._examples
+    
+    def _parameters(self, label, command):
+        """Handler parameters, or None if the command has a time scope they can't express"""
+        if label != 'check_calendar':
+            return {}
+        for pattern, hours in CALENDAR_HORIZONS:
+            match = pattern.search(command)
+            if match:
+                return {'hours': hours if hours is not None else int(match.group(1))}
+        if TIME_SCOPE.search(command):
+            return None
+        return {}
@@ -0,0 +1,125 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from db_utils import open_database, process_singleton
+from config import LLM_CACHE_PATH, LLM_CACHE_MAX_ENTRIES, LLM_CACHE_TTL_SECONDS
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_cache (
+    key TEXT PRIMARY KEY,
+    response TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_llm_cache_created ON llm_cache(created_at);
+"""
+
+
+def make_key(model_name, generation_config, prompt):
+    """Content address of a generation request"""
+    payload = json.dumps([model_name, generation_config or {}, prompt], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class LLMCache:
+    """Cache of LLM responses keyed by model, generation config and prompt.
+    
+    Entries live in a size-bounded LRU in memory and, when a path is set, in a
+    SQLite table so they survive restarts. Both tiers expire entries after ttl seconds.
+    """
+    
+    def __init__(self, path=LLM_CACHE_PATH, max_entries=LLM_CACHE_MAX_ENTRIES, ttl=LLM_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # key -> (created_at, response), least recently used first
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        
+        self.conn = None
+        if path:
+            # The SQLite tier is bounded by the TTL rather than by max_entries
+            self.conn = open_database(path, SCHEMA, 'LLM cache', setup=self._purge_expired, memory_fallback=False)
+    
+    def get(self, key):
+        """Cached response for key, or None"""
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and now - entry[0] < self.ttl:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry:
+                del self.entries[key]
+            
+            if self.conn is not None:
+                row = self.conn.execute(
+                    "SELECT response, created_at FROM llm_cache WHERE key = ? AND created_at > ?",
+                    (key, now - self.ttl)
+                ).fetchone()
+                if row:
+                    self._remember(key, row[1], row[0])
+                    self.hits += 1
+                    return row[0]
+            
+            self.misses += 1
+            return None
+    
+    def put(self, key, response):
+        """Cache a response"""
+        now = time.time()
+        with self.lock:
+            self._remember(key, now, response)
+            if self.conn is not None:
+                try:
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO llm_cache (key, response, created_at) VALUES (?, ?, ?)",
+                        (key, response, now)
+                    )
+                    self.conn.commit()
+                except sqlite3.Error as e:
+                    print(f"Error saving LLM cache entry: {e}")
+    
+    def clear(self):
+        """Drop every cached response"""
+        with self.lock:
+            self.entries.clear()
+            if self.conn is not None:
+                self.conn.execute("DELETE FROM llm_cache")
+                self.conn.commit()
+    
+    def stats(self):
+        """Hit/miss counters for monitoring"""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'entries': len(self.entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'persistent': self.conn is not None
+            }
+    
+    def _remember(self, key, created_at, response):
+        self.entries[key] = (created_at, response)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+    
+    def _purge_expired(self, conn):
+        conn.execute("DELETE FROM llm_cache WHERE created_at <= ?", (time.time() - self.ttl,))
+
+
+@process_singleton
+def get_llm_cache():
+    """Process-wide LLM response cache shared by all agents"""
+    return LLMCache()
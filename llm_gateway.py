@@ -0,0 +1,246 @@
+import asyncio
+import concurrent.futures
+import queue
+import random
+import threading
+import time
+import google.generativeai as genai
+from db_utils import process_singleton
+from config import (
+    GOOGLE_API_KEY, LLM_REQUESTS_PER_MINUTE, LLM_TOKENS_PER_MINUTE,
+    LLM_MAX_IN_FLIGHT, LLM_MAX_RETRIES, LLM_REQUEST_TIMEOUT_SECONDS
+)
+
+
+DEFAULT_MODEL = 'gemini-2.0-flash-lite'
+
+# Tokens budgeted for a response on top of the prompt when charging the TPM bucket
+RESPONSE_TOKEN_ESTIMATE = 256
+
+# Retry backoff: BASE * 2^attempt seconds with jitter; rate limits start from a longer base
+RATE_LIMIT_BACKOFF_SECONDS = 5
+TIMEOUT_BACKOFF_SECONDS = 2
+
+# Marks the end of a streamed response on its chunk queue
+_STREAM_END = object()
+
+
+def estimate_tokens(text):
+    """Rough token count for budgeting prompts (about 4 characters per token)"""
+    return len(text or '') // 4 + 1
+
+
+def is_rate_limit_error(error):
+    error_msg = str(error).lower()
+    return '429' in error_msg or 'rate' in error_msg or 'quota' in error_msg or 'exhausted' in error_msg
+
+
+def is_timeout_error(error):
+    error_msg = str(error).lower()
+    return 'deadline' in error_msg or 'timeout' in error_msg or '504' in error_msg
+
+
+class TokenBucket:
+    """Per-minute budget that refills continuously; acquire() waits without blocking the loop"""
+    
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+    
+    async def acquire(self, amount=1):
+        # A request larger than the whole bucket waits for a full bucket instead of forever
+        amount = min(amount, self.capacity)
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return
+            await asyncio.sleep((amount - self.tokens) / self.rate)
+
+
+class LLMGateway:
+    """Process-wide entry point for Gemini requests.
+    
+    Requests from every agent and thread run on one asyncio loop in a background
+    thread. They share a requests-per-minute and a tokens-per-minute bucket and a
+    limit on requests in flight; rate-limit and timeout errors are retried with
+    jittered backoff on the loop, so waiting never ties up a thread per retry.
+    """
+    
+    def __init__(self, requests_per_minute=LLM_REQUESTS_PER_MINUTE, tokens_per_minute=LLM_TOKENS_PER_MINUTE,
+                 max_in_flight=LLM_MAX_IN_FLIGHT, max_retries=LLM_MAX_RETRIES):
+        genai.configure(api_key=GOOGLE_API_KEY)
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.models = {}
+        self.models_lock = threading.Lock()
+        self.stats_lock = threading.Lock()
+        self.counters = {
+            'requests': 0,
+            'failures': 0,
+            'retries': 0,
+            'in_flight': 0,
+            'throttled_seconds': 0.0
+        }
+        
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run_loop, name='LLMGateway', daemon=True)
+        self._thread.start()
+        # Loop-bound primitives are created on the loop itself
+        asyncio.run_coroutine_threadsafe(self._init_limits(requests_per_minute, tokens_per_minute), self.loop).result()
+    
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+    
+    async def _init_limits(self, requests_per_minute, tokens_per_minute):
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.in_flight = asyncio.Semaphore(self.max_in_flight)
+    
+    def model(self, model_name=DEFAULT_MODEL, generation_config=None):
+        """Shared GenerativeModel for a model name and generation config"""
+        key = (model_name, tuple(sorted((generation_config or {}).items())))
+        with self.models_lock:
+            if key not in self.models:
+                self.models[key] = genai.GenerativeModel(model_name, generation_config=generation_config)
+            return self.models[key]
+    
+    async def generate_async(self, prompt, model_name=DEFAULT_MODEL, generation_config=None, max_retries=None):
+        """Generate a response on the gateway loop and return its text"""
+        if max_retries is None:
+            max_retries = self.max_retries
+        model = self.model(model_name, generation_config)
+        tokens = estimate_tokens(prompt) + RESPONSE_TOKEN_ESTIMATE
+        
+        for attempt in range(max_retries + 1):
+            await self._acquire(tokens)
+            try:
+                response = await model.generate_content_async(prompt)
+                return response.text
+            except Exception as e:
+                error = e
+            finally:
+                self._release()
+            await self._backoff(error, attempt, max_retries)
+    
+    async def _stream_async(self, prompt, model_name, generation_config, chunks):
+        """Put streamed text chunks on a thread-safe queue, ending with _STREAM_END"""
+        model = self.model(model_name, generation_config)
+        tokens = estimate_tokens(prompt) + RESPONSE_TOKEN_ESTIMATE
+        try:
+            for attempt in range(self.max_retries + 1):
+                started = False
+                await self._acquire(tokens)
+                try:
+                    response = await model.generate_content_async(prompt, stream=True)
+                    async for chunk in response:
+                        started = True
+                        chunks.put(chunk.text)
+                    return
+                except Exception as e:
+                    # Once text has reached the caller a retry would repeat it
+                    if started:
+                        self._count('failures')
+                        raise
+                    error = e
+                finally:
+                    self._release()
+                await self._backoff(error, attempt, self.max_retries)
+        except Exception as e:
+            chunks.put(e)
+        finally:
+            chunks.put(_STREAM_END)
+    
+    async def _acquire(self, tokens):
+        waited = time.monotonic()
+        await self.request_bucket.acquire()
+        await self.token_bucket.acquire(tokens)
+        await self.in_flight.acquire()
+        self._count('throttled_seconds', time.monotonic() - waited)
+        self._count('requests')
+        self._count('in_flight')
+    
+    def _release(self):
+        self.in_flight.release()
+        self._count('in_flight', -1)
+    
+    async def _backoff(self, error, attempt, max_retries):
+        """Sleep before retrying a rate-limit or timeout error; raise anything else"""
+        if is_rate_limit_error(error):
+            base, reason = RATE_LIMIT_BACKOFF_SECONDS, 'Rate limit hit'
+        elif is_timeout_error(error):
+            base, reason = TIMEOUT_BACKOFF_SECONDS, 'Timeout'
+        else:
+            self._count('failures')
+            raise error
+        if attempt >= max_retries:
+            self._count('failures')
+            if reason == 'Rate limit hit':
+                raise Exception("Rate limit exceeded. Please wait a moment and try again.")
+            raise error
+        
+        wait_time = base * 2 ** attempt * random.uniform(0.5, 1.5)
+        print(f"[LLMGateway] {reason} on attempt {attempt + 1}, retrying in {wait_time:.1f}s...")
+        self._count('retries')
+        await asyncio.sleep(wait_time)
+    
+    def submit(self, prompt, model_name=DEFAULT_MODEL, generation_config=None, max_retries=None):
+        """Schedule a request from any thread; returns a concurrent.futures.Future of the text"""
+        return asyncio.run_coroutine_threadsafe(
+            self.generate_async(prompt, model_name, generation_config, max_retries),
+            self.loop
+        )
+    
+    def generate(self, prompt, model_name=DEFAULT_MODEL, generation_config=None, max_retries=None,
+                 timeout=LLM_REQUEST_TIMEOUT_SECONDS):
+        """Blocking wrapper around submit() for synchronous callers"""
+        future = self.submit(prompt, model_name, generation_config, max_retries)
+        try:
+            return future.result(timeout=timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise Exception(f"LLM request timeout after {timeout}s")
+    
+    def stream(self, prompt, model_name=DEFAULT_MODEL, generation_config=None, timeout=LLM_REQUEST_TIMEOUT_SECONDS):
+        """Yield response text chunks as Gemini produces them, for synchronous callers"""
+        chunks = queue.Queue()
+        future = asyncio.run_coroutine_threadsafe(
+            self._stream_async(prompt, model_name, generation_config, chunks),
+            self.loop
+        )
+        try:
+            while True:
+                try:
+                    item = chunks.get(timeout=timeout)
+                except queue.Empty:
+                    raise Exception(f"LLM stream stalled for {timeout}s")
+                if item is _STREAM_END:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            # Stops the request if the caller (e.g. a closed SSE connection) stops reading
+            future.cancel()
+    
+    def stats(self):
+        """Request counters for monitoring"""
+        with self.stats_lock:
+            stats = dict(self.counters)
+        stats['max_in_flight'] = self.max_in_flight
+        return stats
+    
+    def _count(self, name, amount=1):
+        with self.stats_lock:
+            self.counters[name] += amount
+
+
+@process_singleton
+def get_llm_gateway():
+    """Process-wide LLM gateway shared by all agents"""
+    return LLMGateway()
@@ -0,0 +1,121 @@
+import random
+import re
+import threading
+from config import MEETING_SIGNAL_THRESHOLD, MEETING_CLASSIFIER_AUDIT_RATE
+
+
+# Each signal adds its weight to an email's score; emails below the threshold skip the LLM
+DATE_PATTERNS = re.compile(
+    r"\b(?:mon|tues?|wed(?:nes)?|thu(?:rs?)?|fri|sat(?:ur)?|sun)(?:day)?\b"
+    r"|\b(?:today|tomorrow|tonight|next week|this week|next month)\b"
+    r"|\b(?:jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec)[a-z]*\.? \d{1,2}(?:st|nd|rd|th)?\b"
+    r"|\b\d{1,2}(?:st|nd|rd|th)? (?:of )?(?:jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec)[a-z]*\b"
+    r"|\b\d{4}-\d{2}-\d{2}\b"
+    r"|\b\d{1,2}/\d{1,2}(?:/\d{2,4})?\b",
+    re.IGNORECASE
+)
+TIME_PATTERNS = re.compile(
+    r"\b\d{1,2}(?::\d{2})?\s*(?:am|pm|a\.m\.|p\.m\.)"
+    r"|\b(?:[01]?\d|2[0-3]):[0-5]\d\b"
+    r"|\b(?:noon|midday|morning|afternoon|evening|eod)\b",
+    re.IGNORECASE
+)
+MEETING_VOCABULARY = re.compile(
+    r"\b(?:meet|meeting|meetings|call|schedule|scheduled|reschedule|availability|available"
+    r"|appointment|invite|invitation|calendar|agenda|sync|catch up|catch-up|interview|demo"
+    r"|conference|zoom|google meet|teams|webex|hangout|slot|rsvp)\b",
+    re.IGNORECASE
+)
+NEGATIVE_VOCABULARY = re.compile(
+    r"\b(?:unsubscribe|receipt|invoice|order (?:number|confirmation)|newsletter|no-reply|noreply"
+    r"|view in browser|promotion|tracking number)\b",
+    re.IGNORECASE
+)
+INVITE_SUBJECT = re.compile(r"^(?:updated )?invitation:", re.IGNORECASE)
+
+INVITE_WEIGHT = 3
+DATE_WEIGHT = 1
+TIME_WEIGHT = 1
+VOCABULARY_WEIGHT = 1
+MAX_VOCABULARY_SCORE = 2
+NEGATIVE_WEIGHT = -1
+
+
+class MeetingClassifier:
+    """Cheap local check for whether an email could contain a meeting request"""
+    
+    def __init__(self, threshold=MEETING_SIGNAL_THRESHOLD, audit_rate=MEETING_CLASSIFIER_AUDIT_RATE):
+        self.threshold = threshold
+        self.audit_rate = audit_rate
+        self.lock = threading.Lock()
+        self.stats = {
+            'checked': 0,
+            'candidates': 0,
+            'skipped': 0,
+            'audited': 0,
+            'audit_misses': 0
+        }
+    
+    def score(self, email):
+        """Score the meeting signals in an email; returns (score, signals)"""
+        text = f"{email.get('subject', '')}\n{email.get('body') or email.get('snippet', '')}"
+        signals = []
+        score = 0
+        
+        if email.get('has_invite') or INVITE_SUBJECT.match(email.get('subject', '')):
+            signals.append('invite')
+            score += INVITE_WEIGHT
+        if DATE_PATTERNS.search(text):
+            signals.append('date')
+            score += DATE_WEIGHT
+        if TIME_PATTERNS.search(text):
+            signals.append('time')
+            score += TIME_WEIGHT
+        
+        words = {match.lower() for match in MEETING_VOCABULARY.findall(text)}
+        if words:
+            signals.append('vocabulary')
+            score += min(len(words) * VOCABULARY_WEIGHT, MAX_VOCABULARY_SCORE)
+        if NEGATIVE_VOCABULARY.search(text):
+            signals.append('bulk')
+            score += NEGATIVE_WEIGHT
+        
+        return score, signals
+    
+    def split(self, emails):
+        """Split emails into (candidates, audited, skipped) for LLM extraction
+        
+        Audited emails are a random sample of the low-scoring ones that still go to the
+        LLM, so the recall of the pre-filter can be measured with record_audit().
+        """
+        candidates, audited, skipped = [], [], []
+        for email in emails:
+            score, _ = self.score(email)
+            if score >= self.threshold:
+                candidates.append(email)
+            elif self.audit_rate and random.random() < self.audit_rate:
+                audited.append(email)
+            else:
+                skipped.append(email)
+        
+        with self.lock:
+            self.stats['checked'] += len(emails)
+            self.stats['candidates'] += len(candidates)
+            self.stats['skipped'] += len(skipped) + len(audited)
+            self.stats['audited'] += len(audited)
+        return candidates, audited, skipped
+    
+    def record_audit(self, is_meeting):
+        """Record the LLM verdict for an audited email the pre-filter would have skipped"""
+        if is_meeting:
+            with self.lock:
+                self.stats['audit_misses'] += 1
+    
+    def get_stats(self):
+        """Counters plus the recall estimated from audited emails"""
+        with self.lock:
+            stats = dict(self.stats)
+        if stats['audited']:
+            # Share of skipped emails that really were meeting requests
+            stats['estimated_miss_rate'] = stats['audit_misses'] / stats['audited']
+        return stats
@@ -0,0 +1,234 @@
+import json
+import threading
+import time
+from email.utils import parseaddr, parsedate_to_datetime
+from config import MESSAGE_STORE_PATH
+from db_utils import open_database, process_singleton
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id TEXT PRIMARY KEY,
+    thread_id TEXT,
+    sender TEXT,
+    sender_address TEXT,
+    subject TEXT,
+    date TEXT,
+    date_ts REAL,
+    snippet TEXT,
+    body TEXT,
+    mini_summary TEXT,
+    summarized INTEGER NOT NULL DEFAULT 0,
+    auto_replied INTEGER NOT NULL DEFAULT 0,
+    meetings_extracted INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_messages_thread ON messages(thread_id);
+CREATE INDEX IF NOT EXISTS idx_messages_sender ON messages(sender_address);
+CREATE INDEX IF NOT EXISTS idx_messages_date ON messages(date_ts);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT,
+    updated_at REAL
+);
+"""
+
+EMAIL_COLUMNS = 'id, thread_id, sender, subject, date, snippet, body'
+
+
+class MessageStore:
+    """Local SQLite store of parsed emails and their processing state"""
+    
+    STATE_FLAGS = ('summarized', 'auto_replied', 'meetings_extracted')
+    
+    def __init__(self, path=MESSAGE_STORE_PATH):
+        self.lock = threading.Lock()
+        self.conn = open_database(path, SCHEMA, 'message store')
+    
+    def put(self, email):
+        """Insert or update one parsed email"""
+        self.put_many([email])
+    
+    def put_many(self, emails):
+        """Insert or update parsed emails, keeping their processing state"""
+        now = time.time()
+        rows = [(
+            email['id'],
+            email.get('thread_id'),
+            email.get('sender'),
+            parseaddr(email.get('sender', ''))[1].lower(),
+            email.get('subject'),
+            email.get('date'),
+            self._timestamp(email.get('date')),
+            email.get('snippet'),
+            dict.get(email, 'body'),  # never trigger a lazy body load just to store it
+            now
+        ) for email in emails]
+        
+        with self.lock:
+            self.conn.executemany("""
+                INSERT INTO messages (id, thread_id, sender, sender_address, subject, date, date_ts, snippet, body, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(id) DO UPDATE SET
+                    thread_id = excluded.thread_id,
+                    sender = excluded.sender,
+                    sender_address = excluded.sender_address,
+                    subject = excluded.subject,
+                    date = excluded.date,
+                    date_ts = excluded.date_ts,
+                    snippet = COALESCE(excluded.snippet, messages.snippet),
+                    body = COALESCE(excluded.body, messages.body),
+                    updated_at = excluded.updated_at
+            """, rows)
+            self.conn.commit()
+    
+    def set_body(self, msg_id, body):
+        """Store the decoded body of an already stored email"""
+        with self.lock:
+            self.conn.execute(
+                "UPDATE messages SET body = ?, updated_at = ? WHERE id = ?",
+                (body, time.time(), msg_id)
+            )
+            self.conn.commit()
+    
+    def get(self, msg_id):
+        """Return the stored email for msg_id, or None"""
+        return self.get_many([msg_id]).get(msg_id)
+    
+    def get_many(self, msg_ids):
+        """Return {id: email} for the ids that are stored"""
+        found = {}
+        msg_ids = list(msg_ids)
+        with self.lock:
+            # Stay well under SQLite's bound-parameter limit
+            for start in range(0, len(msg_ids), 500):
+                chunk = msg_ids[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self.conn.execute(
+                    f"SELECT {EMAIL_COLUMNS} FROM messages WHERE id IN ({placeholders})",
+                    chunk
+                ).fetchall()
+                for row in rows:
+                    found[row['id']] = dict(row)
+        return found
+    
+    def by_thread(self, thread_id):
+        """Emails in a thread, oldest first"""
+        return self._query(
+            f"SELECT {EMAIL_COLUMNS} FROM messages WHERE thread_id = ? ORDER BY date_ts",
+            (thread_id,)
+        )
+    
+    def by_sender(self, sender, limit=50):
+        """Most recent emails from a sender address"""
+        address = parseaddr(sender)[1].lower() or sender.lower()
+        return self._query(
+            f"SELECT {EMAIL_COLUMNS} FROM messages WHERE sender_address = ? ORDER BY date_ts DESC LIMIT ?",
+            (address, limit)
+        )
+    
+    def recent(self, since=None, limit=50):
+        """Most recent emails, optionally only those dated after `since` (epoch seconds)"""
+        return self._query(
+            f"SELECT {EMAIL_COLUMNS} FROM messages WHERE date_ts >= ? ORDER BY date_ts DESC LIMIT ?",
+            (since or 0, limit)
+        )
+    
+    def mark(self, msg_ids, flag, value=True):
+        """Set a processing-state flag on the given messages"""
+        if flag not in self.STATE_FLAGS:
+            raise ValueError(f"Unknown processing flag: {flag}")
+        rows = [(int(value), time.time(), msg_id) for msg_id in msg_ids]
+        with self.lock:
+            self.conn.executemany(
+                f"UPDATE messages SET {flag} = ?, updated_at = ? WHERE id = ?",
+                rows
+            )
+            self.conn.commit()
+    
+    def set_mini_summaries(self, summaries):
+        """Store one-line summaries, given as {msg_id: summary}"""
+        now = time.time()
+        with self.lock:
+            self.conn.executemany(
+                "UPDATE messages SET mini_summary = ?, updated_at = ? WHERE id = ?",
+                [(summary, now, msg_id) for msg_id, summary in summaries.items()]
+            )
+            self.conn.commit()
+    
+    def mini_summaries(self, msg_ids):
+        """{msg_id: summary} for the given messages that have one"""
+        msg_ids = list(msg_ids)
+        found = {}
+        with self.lock:
+            for start in range(0, len(msg_ids), 500):
+                chunk = msg_ids[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self.conn.execute(
+                    f"SELECT id, mini_summary FROM messages WHERE mini_summary IS NOT NULL AND id IN ({placeholders})",
+                    chunk
+                ).fetchall()
+                found.update((row['id'], row['mini_summary']) for row in rows)
+        return found
+    
+    def evict_mini_summaries(self, keep_ids):
+        """Drop the summaries of every message not in keep_ids; returns how many were dropped"""
+        keep_ids = set(keep_ids)
+        with self.lock:
+            rows = self.conn.execute("SELECT id FROM messages WHERE mini_summary IS NOT NULL").fetchall()
+            evict = [(row['id'],) for row in rows if row['id'] not in keep_ids]
+            self.conn.executemany("UPDATE messages SET mini_summary = NULL WHERE id = ?", evict)
+            self.conn.commit()
+        return len(evict)
+    
+    def put_meta(self, key, value):
+        """Store a JSON-serializable value shared with other processes using the store"""
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value, updated_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), time.time())
+            )
+            self.conn.commit()
+    
+    def get_meta(self, key):
+        """Value stored under key, or None"""
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row['value']) if row else None
+    
+    def is_marked(self, msg_id, flag):
+        """True if the message has the given processing-state flag set"""
+        return msg_id in self.marked([msg_id], flag)
+    
+    def marked(self, msg_ids, flag):
+        """Subset of msg_ids that have the given processing-state flag set"""
+        if flag not in self.STATE_FLAGS:
+            raise ValueError(f"Unknown processing flag: {flag}")
+        msg_ids = list(msg_ids)
+        marked = set()
+        with self.lock:
+            for start in range(0, len(msg_ids), 500):
+                chunk = msg_ids[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self.conn.execute(
+                    f"SELECT id FROM messages WHERE {flag} = 1 AND id IN ({placeholders})",
+                    chunk
+                ).fetchall()
+                marked.update(row['id'] for row in rows)
+        return marked
+    
+    def _query(self, sql, params):
+        with self.lock:
+            return [dict(row) for row in self.conn.execute(sql, params).fetchall()]
+    
+    def _timestamp(self, date):
+        try:
+            return parsedate_to_datetime(date).timestamp()
+        except Exception:
+            return None
+
+
+@process_singleton
+def get_message_store():
+    """Process-wide message store shared by every GmailHandler"""
+    return MessageStore()
@@ -0,0 +1,122 @@
+import base64
+import html
+import re
+from config import EMAIL_BODY_MAX_BYTES
+
+
+# HTML markup usually outweighs its text several times over, so HTML parts
+# get a larger raw-byte allowance before conversion
+HTML_BUDGET_FACTOR = 4
+
+_SKIP_BLOCKS = re.compile(r'<(script|style|head)\b.*?</\1\s*>', re.IGNORECASE | re.DOTALL)
+_LINE_BREAKS = re.compile(r'<br\s*/?>|</(p|div|tr|li|h[1-6]|table|blockquote)\s*>', re.IGNORECASE)
+_TAGS = re.compile(r'<[^>]+>')
+_SPACES = re.compile(r'[ \t\r\f\v]+')
+_BLANK_LINES = re.compile(r'\n\s*\n+')
+_CHARSET = re.compile(r'charset="?([\w.:-]+)"?', re.IGNORECASE)
+
+
+def iter_parts(payload):
+    """Yield every leaf part of a Gmail message payload, depth first, in order"""
+    stack = [payload]
+    while stack:
+        part = stack.pop()
+        children = part.get('parts')
+        if children:
+            stack.extend(reversed(children))
+        else:
+            yield part
+
+
+def extract_text(payload, max_bytes=EMAIL_BODY_MAX_BYTES):
+    """Extract readable text from a message payload within a byte budget.
+    
+    text/plain parts are used when present; otherwise text/html parts are
+    converted to text. Decoding stops as soon as the budget is used up.
+    """
+    chunks = []
+    remaining = max_bytes
+    html_parts = []
+    
+    for part in iter_parts(payload):
+        if _is_attachment(part):
+            continue
+        mime_type = part.get('mimeType', '')
+        if mime_type == 'text/plain':
+            text = _decode_part(part, remaining)
+            if text:
+                chunks.append(text)
+                remaining -= len(text.encode('utf-8'))
+                if remaining <= 0:
+                    break
+        elif mime_type == 'text/html' and not chunks:
+            # Remember HTML parts, but only decode them if no plain text turns up
+            html_parts.append(part)
+    
+    if not chunks:
+        for part in html_parts:
+            text = html_to_text(_decode_part(part, remaining * HTML_BUDGET_FACTOR))
+            if text:
+                chunks.append(text)
+                remaining -= len(text.encode('utf-8'))
+                if remaining <= 0:
+                    break
+    
+    return '\n'.join(chunks)
+
+
+def html_to_text(markup):
+    """Fast, regex-based HTML to plain text conversion"""
+    if not markup:
+        return ''
+    text = _SKIP_BLOCKS.sub(' ', markup)
+    text = _LINE_BREAKS.sub('\n', text)
+    text = _TAGS.sub(' ', text)
+    text = html.unescape(text)
+    text = _SPACES.sub(' ', text)
+    text = _BLANK_LINES.sub('\n\n', text)
+    return '\n'.join(line.strip() for line in text.split('\n')).strip()
+
+
+def has_part(payload, mime_type):
+    """True if any leaf part of the payload has the given MIME type"""
+    return any(part.get('mimeType') == mime_type for part in iter_parts(payload))
+
+
+def decode_base64url(data, max_bytes=None):
+    """Decode Gmail's base64url data, decoding at most max_bytes of output"""
+    if max_bytes is not None:
+        # Every 4 encoded characters hold 3 bytes
+        data = data[:-(-max_bytes // 3) * 4]
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+
+def _decode_part(part, max_bytes):
+    data = part.get('body', {}).get('data')
+    if not data or max_bytes <= 0:
+        return ''
+    raw = decode_base64url(data, max_bytes)[:max_bytes]
+    # A truncated multi-byte character at the cut is dropped rather than raising
+    return raw.decode(_charset(part), errors='ignore')
+
+
+def _charset(part):
+    for header in part.get('headers', []):
+        if header['name'].lower() == 'content-type':
+            match = _CHARSET.search(header['value'])
+            if match:
+                try:
+                    ''.encode(match.group(1))
+                    return match.group(1)
+                except LookupError:
+                    break
+    return 'utf-8'
+
+
+def _is_attachment(part):
+    if part.get('filename'):
+        return True
+    for header in part.get('headers', []):
+        if header['name'].lower() == 'content-disposition' and header['value'].lower().startswith('attachment'):
+            return True
+    return False
@@ -0,0 +1,205 @@
+import random
+import threading
+import time
+from db_utils import open_database, process_singleton
+from config import OUTBOX_PATH, OUTBOX_SENDS_PER_SECOND, OUTBOX_MAX_ATTEMPTS
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    to_addr TEXT NOT NULL,
+    subject TEXT,
+    body TEXT,
+    thread_id TEXT,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    last_error TEXT,
+    message_id TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox(status, next_attempt_at);
+"""
+
+# An email left 'sending' for this long belongs to a process that died mid-send
+SENDING_TIMEOUT_SECONDS = 300
+
+# Backoff for retryable failures: BASE * 2^(attempt - 1) seconds, capped, with jitter
+BACKOFF_BASE_SECONDS = 2
+BACKOFF_MAX_SECONDS = 300
+
+
+class Outbox:
+    """Persistent queue of outgoing emails drained by a rate-limited background sender.
+    
+    Statuses: queued -> sending -> sent, or failed once a message runs out of
+    attempts or hits a non-retryable error. 429 and 5xx responses are retried
+    with exponential backoff. Several processes (the web app and main.py) may
+    share the database: an email is claimed atomically, so only one of them sends it.
+    """
+    
+    def __init__(self, send_func, path=OUTBOX_PATH, sends_per_second=OUTBOX_SENDS_PER_SECOND,
+                 max_attempts=OUTBOX_MAX_ATTEMPTS):
+        self.send_func = send_func
+        self.min_interval = 1.0 / sends_per_second if sends_per_second > 0 else 0
+        self.max_attempts = max_attempts
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition(self.lock)
+        self._worker = None
+        self._last_send = 0
+        
+        self.conn = open_database(path, SCHEMA, 'outbox')
+        
+        # Mail left over from before a restart is sent without waiting for new mail.
+        # Rows a crashed process left 'sending' are requeued by _claim_next once stale.
+        if self.pending_count():
+            self.start()
+    
+    def enqueue(self, to, subject, body, thread_id=None):
+        """Queue an email for delivery and return its outbox id"""
+        now = time.time()
+        with self.lock:
+            cursor = self.conn.execute("""
+                INSERT INTO outbox (to_addr, subject, body, thread_id, next_attempt_at, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (to, subject, body, thread_id, now, now, now))
+            self.conn.commit()
+            self.wakeup.notify()
+        self.start()
+        return cursor.lastrowid
+    
+    def status(self, outbox_id):
+        """Delivery status of a queued email, or None if the id is unknown"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT id, to_addr, subject, status, attempts, last_error, message_id, created_at, updated_at "
+                "FROM outbox WHERE id = ?",
+                (outbox_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        status = dict(row)
+        status['to'] = status.pop('to_addr')
+        return status
+    
+    def pending_count(self):
+        """Number of emails not yet sent or failed"""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT COUNT(*) FROM outbox WHERE status IN ('queued', 'sending')"
+            ).fetchone()[0]
+    
+    def drain(self, timeout=None):
+        """Wait until no email is waiting to be sent; returns False on timeout.
+        
+        The sender is a daemon thread, so one-shot scripts call this before exiting.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        self.start()
+        while self.pending_count():
+            if deadline is not None and time.time() >= deadline:
+                return False
+            time.sleep(0.5)
+        return True
+    
+    def start(self):
+        """Start the background sender if it is not running"""
+        with self.lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='outbox-sender', daemon=True)
+                self._worker.start()
+    
+    def _run(self):
+        while True:
+            # Respect the sends-per-second budget before taking the next email
+            wait = self._last_send + self.min_interval - time.time()
+            if wait > 0:
+                time.sleep(wait)
+            
+            with self.lock:
+                item = self._claim_next()
+                if item is None:
+                    self.wakeup.wait(timeout=self._seconds_until_next_due())
+                    continue
+            
+            self._deliver(item)
+    
+    def _claim_next(self):
+        """Mark the next due email as 'sending' and return it (lock held)"""
+        now = time.time()
+        self.conn.execute(
+            "UPDATE outbox SET status = 'queued', updated_at = ? WHERE status = 'sending' AND updated_at < ?",
+            (now, now - SENDING_TIMEOUT_SECONDS)
+        )
+        self.conn.commit()
+        while True:
+            row = self.conn.execute("""
+                SELECT * FROM outbox
+                WHERE status = 'queued' AND next_attempt_at <= ?
+                ORDER BY next_attempt_at, id LIMIT 1
+            """, (now,)).fetchone()
+            if row is None:
+                return None
+            # Another process sharing the database may claim the same row first
+            cursor = self.conn.execute(
+                "UPDATE outbox SET status = 'sending', updated_at = ? WHERE id = ? AND status = 'queued'",
+                (time.time(), row['id'])
+            )
+            self.conn.commit()
+            if cursor.rowcount == 1:
+                return dict(row)
+    
+    def _seconds_until_next_due(self):
+        """How long the sender may sleep before a backed-off email is due (lock held)"""
+        next_due = self.conn.execute(
+            "SELECT MIN(next_attempt_at) FROM outbox WHERE status = 'queued'"
+        ).fetchone()[0]
+        if next_due is None:
+            return 60
+        return max(0.0, min(60, next_due - time.time()))
+    
+    def _deliver(self, item):
+        attempts = item['attempts'] + 1
+        self._last_send = time.time()
+        try:
+            response = self.send_func(item['to_addr'], item['subject'], item['body'], item['thread_id'])
+            self._update(item['id'], status='sent', attempts=attempts, last_error=None,
+                         message_id=(response or {}).get('id'))
+            print(f"Email sent to {item['to_addr']}")
+        except Exception as e:
+            if self._is_retryable(e) and attempts < self.max_attempts:
+                delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** (attempts - 1))
+                delay *= random.uniform(0.5, 1.5)
+                print(f"Error sending email to {item['to_addr']}, retrying in {delay:.0f}s: {e}")
+                self._update(item['id'], status='queued', attempts=attempts, last_error=str(e),
+                             next_attempt_at=time.time() + delay)
+            else:
+                print(f"Error sending email to {item['to_addr']}, giving up: {e}")
+                self._update(item['id'], status='failed', attempts=attempts, last_error=str(e))
+    
+    def _update(self, outbox_id, **fields):
+        fields['updated_at'] = time.time()
+        assignments = ', '.join(f"{column} = ?" for column in fields)
+        with self.lock:
+            self.conn.execute(
+                f"UPDATE outbox SET {assignments} WHERE id = ?",
+                (*fields.values(), outbox_id)
+            )
+            self.conn.commit()
+    
+    def _is_retryable(self, error):
+        """Rate limits (429) and server errors (5xx) are worth retrying"""
+        status = getattr(getattr(error, 'resp', None), 'status', None)
+        if status is None:
+            message = str(error)
+            return '429' in message or 'rate' in message.lower()
+        status = int(status)
+        return status == 429 or 500 <= status < 600
+
+
+@process_singleton
+def get_outbox(send_func):
+    """Process-wide outbox; send_func is only used when it is first created"""
+    return Outbox(send_func)
@@ -0,0 +1,145 @@
+import re
+import threading
+from llm_gateway import estimate_tokens
+
+
+# Everything after one of these markers is quoted history from earlier in the thread
+QUOTE_MARKERS = re.compile(
+    r"^On\b[^\n]{0,200}(?:\n[^\n]{0,200})?\bwrote:[ \t]*$"
+    r"|^-{2,}\s*(?:Original|Forwarded) Message\s*-{2,}"
+    r"|^_{10,}[ \t]*$"
+    r"|^From:[^\n]*\n(?:[^\n]*\n){0,3}?(?:Sent|Date):",
+    re.IGNORECASE | re.MULTILINE
+)
+# Everything after one of these is a signature
+SIGNATURE_MARKERS = re.compile(
+    r"^(?:--|__)[ \t]*$|^Sent from my \w+|^Get Outlook for",
+    re.IGNORECASE | re.MULTILINE
+)
+# Legal disclaimers and mailing-list notices; a paragraph with one of these is only
+# dropped from the end of an email, so a sentence that merely says "confidential" stays
+FOOTER_NOTICES = re.compile(
+    r"\bconfidentiality notice\b"
+    r"|\bthis (?:e-?mail|message|communication)\b[^\n]{0,80}\b(?:is|are|may be|may contain|contains)\b[^\n]{0,40}\b(?:confidential|privileged)"
+    r"|\bintended (?:solely |only )?for the (?:use of the )?(?:named |intended )?(?:recipient|addressee|individual)"
+    r"|\bif you (?:have )?received this (?:e-?mail|message|communication) in error"
+    r"|\bto unsubscribe\b|\bunsubscribe (?:here|from|at any time)\b|\bclick here to unsubscribe"
+    r"|\bview (?:it |this (?:e-?mail|message) )?in (?:your )?browser"
+    r"|\ball rights reserved\b|(?:©|\(c\))\s*(?:19|20)\d{2}"
+    r"|\bmanage (?:your )?(?:e-?mail )?(?:preferences|subscriptions?)\b",
+    re.IGNORECASE
+)
+# Lines made up only of footer links ("Unsubscribe | Privacy Policy"), dropped wherever they appear
+FOOTER_LINK_LINE = re.compile(
+    r"^\W*(?:(?:unsubscribe|privacy policy|privacy|terms(?: of (?:service|use))?|view (?:it )?in (?:your )?browser"
+    r"|manage (?:your )?preferences|contact us)\W*)+$",
+    re.IGNORECASE
+)
+
+# Paragraphs shorter than this are never treated as duplicates ("Thanks!", "Hi all,")
+MIN_DEDUPE_CHARS = 40
+# Emails that would get fewer tokens than this are dropped instead of cut to nothing
+MIN_TOKENS_PER_EMAIL = 32
+
+_stats = {'prompts': 0, 'tokens_before': 0, 'tokens_after': 0, 'emails_dropped': 0}
+_stats_lock = threading.Lock()
+
+
+def compact_text(text):
+    """Strip quoted history, signatures, footer links and trailing legal/mailing-list notices from an email body"""
+    if not text:
+        return ''
+    text = text.replace('\r\n', '\n')
+    
+    for markers in (QUOTE_MARKERS, SIGNATURE_MARKERS):
+        match = markers.search(text)
+        # A marker on the very first line means there is nothing but quoted text - keep it
+        if match and text[:match.start()].strip():
+            text = text[:match.start()]
+    
+    lines = [
+        line.rstrip() for line in text.split('\n')
+        if not line.lstrip().startswith('>') and not FOOTER_LINK_LINE.match(line.strip())
+    ]
+    text = '\n'.join(lines)
+    text = re.sub(r'[ \t]+', ' ', text)
+    text = re.sub(r'\n{3,}', '\n\n', text).strip()
+    
+    # Footer notices are cut from the end only, and never the first paragraph
+    paragraphs = text.split('\n\n')
+    while len(paragraphs) > 1 and FOOTER_NOTICES.search(paragraphs[-1]):
+        paragraphs.pop()
+    return '\n\n'.join(paragraphs)
+
+
+def truncate_to_tokens(text, max_tokens):
+    """Cut text to roughly max_tokens, at a word boundary"""
+    max_chars = max_tokens * 4
+    if len(text) <= max_chars:
+        return text
+    cut = text.rfind(' ', 0, max_chars)
+    return text[:cut if cut > max_chars // 2 else max_chars].rstrip() + ' [...]'
+
+
+def compact_emails(texts, token_budget, per_email_tokens=None):
+    """Compact email texts to fit token_budget in total.
+    
+    texts are in priority order. Paragraphs repeated from an earlier email (the same
+    thread quoted again) are removed, then the budget is shared out so short emails
+    keep all their text and long ones are cut evenly. If the budget cannot give every
+    email MIN_TOKENS_PER_EMAIL, the lowest-priority emails get '' instead.
+    Returns (compacted_texts, stats).
+    """
+    seen = set()
+    compacted = []
+    for text in texts:
+        paragraphs = []
+        for paragraph in compact_text(text).split('\n\n'):
+            key = ' '.join(paragraph.lower().split())
+            if len(key) >= MIN_DEDUPE_CHARS:
+                if key in seen:
+                    continue
+                seen.add(key)
+            paragraphs.append(paragraph)
+        compacted.append('\n\n'.join(paragraphs))
+    
+    sizes = [estimate_tokens(text) for text in compacted]
+    if per_email_tokens is not None:
+        sizes = [min(size, per_email_tokens) for size in sizes]
+    
+    keep = min(len(compacted), max(1, token_budget // MIN_TOKENS_PER_EMAIL))
+    allocation = [0] * len(compacted)
+    remaining = token_budget
+    # Smallest first: each email takes what it needs up to an even share of what is left
+    for position, index in enumerate(sorted(range(keep), key=lambda i: sizes[i])):
+        allocation[index] = min(sizes[index], remaining // (keep - position))
+        remaining -= allocation[index]
+    
+    result = [
+        truncate_to_tokens(text, tokens) if tokens else ''
+        for text, tokens in zip(compacted, allocation)
+    ]
+    stats = {
+        'tokens_before': sum(estimate_tokens(text) for text in texts),
+        'tokens_after': sum(estimate_tokens(text) for text in result if text),
+        'emails_dropped': len(texts) - keep
+    }
+    stats['tokens_saved'] = max(0, stats['tokens_before'] - stats['tokens_after'])
+    _record(stats)
+    return result, stats
+
+
+def compaction_stats():
+    """Totals over every prompt compacted by this process"""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats['tokens_saved'] = max(0, stats['tokens_before'] - stats['tokens_after'])
+    return stats
+
+
+def _record(stats):
+    with _stats_lock:
+        _stats['prompts'] += 1
+        _stats['tokens_before'] += stats['tokens_before']
+        _stats['tokens_after'] += stats['tokens_after']
+        _stats['emails_dropped'] += stats['emails_dropped']
@@ -0,0 +1,99 @@
+import threading
+import time
+from db_utils import process_singleton
+from config import RAG_EMBEDDING_MODEL, RAG_DB_PATH
+
+
+class RAGResources:
+    """Process-wide embedding model and Chroma vector store, loaded on first use.
+    
+    Loading the SentenceTransformer and opening the Chroma client takes seconds,
+    so nothing is loaded until a caller needs it. Each resource has its own lock,
+    so concurrent callers load it once and a slow model load does not hold up the
+    vector store. warm_up() loads both on a background thread ahead of the first
+    query, and report() says what is loaded and how long each load took.
+    """
+    
+    def __init__(self, model_name=RAG_EMBEDDING_MODEL, db_path=RAG_DB_PATH):
+        self.model_name = model_name
+        self.db_path = db_path
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._client = None
+        self._collections = {}
+        self._client_lock = threading.Lock()
+        self.load_seconds = {}
+        self.errors = {}
+    
+    def embedding_model(self):
+        """Shared SentenceTransformer, loaded on the first call"""
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    started = time.perf_counter()
+                    try:
+                        # Imported here so processes that never use RAG don't pay for it
+                        from sentence_transformers import SentenceTransformer
+                        self._model = SentenceTransformer(self.model_name)
+                    except Exception as e:
+                        self.errors['embedding_model'] = str(e)
+                        raise
+                    self._loaded('embedding_model', started)
+        return self._model
+    
+    def loaded_embedding_model(self):
+        """The embedding model if it is already loaded, else None (never triggers a load)"""
+        return self._model
+    
+    def collection(self, name):
+        """Shared Chroma collection, opening the client on the first call"""
+        with self._client_lock:
+            if self._client is None:
+                started = time.perf_counter()
+                try:
+                    import chromadb
+                    self._client = chromadb.PersistentClient(path=self.db_path)
+                except Exception as e:
+                    self.errors['vector_store'] = str(e)
+                    raise
+                self._loaded('vector_store', started)
+            if name not in self._collections:
+                self._collections[name] = self._client.get_or_create_collection(name)
+            return self._collections[name]
+    
+    def warm_up(self, collection_name='resume_kb'):
+        """Load the model and open the vector store on a background thread"""
+        def load():
+            try:
+                self.collection(collection_name)
+                self.embedding_model()
+            except Exception as e:
+                print(f"[RAGResources] Warm-up failed: {e}")
+        
+        thread = threading.Thread(target=load, name='RAGWarmUp', daemon=True)
+        thread.start()
+        return thread
+    
+    def report(self):
+        """Load state and load time of each resource"""
+        report = {}
+        for resource, loaded in (('embedding_model', self._model is not None),
+                                 ('vector_store', self._client is not None)):
+            report[resource] = {
+                'loaded': loaded,
+                'load_seconds': self.load_seconds.get(resource),
+                'error': self.errors.get(resource)
+            }
+        return report
+    
+    def _loaded(self, resource, started):
+        elapsed = time.perf_counter() - started
+        self.load_seconds[resource] = round(elapsed, 2)
+        self.errors.pop(resource, None)
+        print(f"[RAGResources] Loaded {resource.replace('_', ' ')} in {elapsed:.1f}s")
+
+
+@process_singleton
+def get_rag_resources():
+    """Process-wide RAG resources shared by all agents"""
+    return RAGResources()
@@ -0,0 +1,165 @@
+import heapq
+import sqlite3
+import threading
+import time
+from datetime import timedelta
+from calendar_mirror import event_bounds
+from db_utils import open_database
+from config import REMINDER_HOURS_BEFORE, REMINDER_STATE_PATH
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fired_reminders (
+    reminder_key TEXT PRIMARY KEY,
+    fired_at REAL NOT NULL
+);
+"""
+
+# Fired-reminder records older than this are purged at startup
+FIRED_RETENTION_SECONDS = 7 * 24 * 3600
+
+
+class ReminderScheduler:
+    """Fires each event's reminder once, at its exact offset before the start.
+    
+    Reminders sit in a min-heap ordered by fire time and a background thread
+    sleeps until the earliest one is due. Moved events are rescheduled
+    (heap entries for the old time are skipped when popped). Each reminder is
+    claimed in a SQLite table before it fires, so neither a restart nor a second
+    process (main.py next to the web app) fires it again.
+    """
+    
+    def __init__(self, on_fire, hours_before=REMINDER_HOURS_BEFORE, path=REMINDER_STATE_PATH):
+        self.on_fire = on_fire
+        self.offset = timedelta(hours=hours_before)
+        self.heap = []        # (fire at, reminder key, event id)
+        self.scheduled = {}   # event id -> (reminder key, event)
+        self.cond = threading.Condition()
+        self._thread = None
+        cutoff = time.time() - FIRED_RETENTION_SECONDS
+        self.conn = open_database(
+            path, SCHEMA, 'reminder state',
+            setup=lambda conn: conn.execute("DELETE FROM fired_reminders WHERE fired_at < ?", (cutoff,))
+        )
+    
+    def sync(self, events):
+        """Schedule reminders for these upcoming events.
+        
+        The list is taken as the complete set of upcoming events, so scheduled
+        reminders for events no longer in it are dropped.
+        """
+        now = time.time()
+        with self.cond:
+            seen = set()
+            for event in events:
+                if not event.get('start', {}).get('dateTime'):
+                    continue  # all-day events get no reminder
+                bounds = event_bounds(event)
+                if not bounds or bounds[0].timestamp() <= now:
+                    continue
+                
+                seen.add(event['id'])
+                key = self._key(event)
+                current = self.scheduled.get(event['id'])
+                if current and current[0] == key:
+                    self.scheduled[event['id']] = (key, event)  # keep the latest details
+                    continue
+                if self._is_fired(key):
+                    continue
+                
+                self.scheduled[event['id']] = (key, event)
+                heapq.heappush(self.heap, ((bounds[0] - self.offset).timestamp(), key, event['id']))
+            
+            for event_id in [event_id for event_id in self.scheduled if event_id not in seen]:
+                del self.scheduled[event_id]
+            
+            self.cond.notify()
+    
+    def pending(self):
+        """Number of reminders scheduled but not yet fired"""
+        with self.cond:
+            return len(self.scheduled)
+    
+    def next_fire_time(self):
+        """Epoch seconds of the next reminder, or None"""
+        with self.cond:
+            self._drop_stale()
+            return self.heap[0][0] if self.heap else None
+    
+    def fire_due(self):
+        """Fire every reminder that is due now, in the calling thread"""
+        fired = []
+        while True:
+            with self.cond:
+                event = self._pop_due()
+            if event is None:
+                return fired
+            fired.append((event, self.on_fire(event)))
+    
+    def start(self):
+        """Start the background thread that fires reminders on time"""
+        with self.cond:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='reminder-scheduler', daemon=True)
+                self._thread.start()
+    
+    def _run(self):
+        while True:
+            with self.cond:
+                event = self._pop_due()
+                while event is None:
+                    next_fire = self.next_fire_time()
+                    self.cond.wait(timeout=None if next_fire is None else max(0, next_fire - time.time()))
+                    event = self._pop_due()
+            
+            try:
+                self.on_fire(event)
+            except Exception as e:
+                print(f"Error firing reminder for {event.get('summary')}: {e}")
+    
+    def _pop_due(self):
+        """Pop the earliest due reminder this process wins the claim on (lock held)"""
+        while True:
+            self._drop_stale()
+            if not self.heap or self.heap[0][0] > time.time():
+                return None
+            
+            _, key, event_id = heapq.heappop(self.heap)
+            _, event = self.scheduled.pop(event_id)
+            if self._claim(key):
+                return event
+    
+    def _claim(self, key):
+        """Record a reminder as fired; False if another process already fired it (lock held)"""
+        try:
+            cursor = self.conn.execute(
+                "INSERT OR IGNORE INTO fired_reminders (reminder_key, fired_at) VALUES (?, ?)",
+                (key, time.time())
+            )
+            self.conn.commit()
+            return cursor.rowcount == 1
+        except sqlite3.Error as e:
+            # Better a reminder fired twice than one never fired
+            print(f"Error saving reminder state: {e}")
+            return True
+    
+    def _is_fired(self, key):
+        try:
+            return self.conn.execute(
+                "SELECT 1 FROM fired_reminders WHERE reminder_key = ?", (key,)
+            ).fetchone() is not None
+        except sqlite3.Error:
+            return False
+    
+    def _drop_stale(self):
+        """Discard heap entries for events that moved or were removed (lock held)"""
+        while self.heap:
+            _, key, event_id = self.heap[0]
+            current = self.scheduled.get(event_id)
+            if current and current[0] == key:
+                return
+            heapq.heappop(self.heap)
+    
+    def _key(self, event):
+        # Includes the start time, so a moved event gets a fresh reminder
+        return f"{event['id']}|{event['start']['dateTime']}"
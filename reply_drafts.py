@@ -0,0 +1,300 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from email.utils import parseaddr
+from prompt_compactor import compact_text, truncate_to_tokens
+from rag_resources import get_rag_resources
+from db_utils import open_database
+from config import (
+    REPLY_DRAFT_CACHE_PATH, REPLY_DRAFT_SIMILARITY_THRESHOLD, REPLY_DRAFT_TTL_SECONDS,
+    REPLY_DRAFT_MAX_ENTRIES
+)
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reply_drafts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    reply_type TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    embedding TEXT NOT NULL,
+    template TEXT NOT NULL,
+    fields TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_reply_drafts_created ON reply_drafts(created_at);
+"""
+
+# Drafts are only valid for the profile and documents they were written from
+PROFILE_PATH = 'user_profile.json'
+CONFIG_PATH = 'auto_reply_config.json'
+RAG_DATA_PATH = 'rag_data'
+
+# Sender domains that say nothing about the sender's company
+FREE_MAIL_DOMAINS = {
+    'gmail', 'googlemail', 'yahoo', 'outlook', 'hotmail', 'live', 'msn', 'icloud', 'me',
+    'aol', 'proton', 'protonmail', 'gmx', 'mail', 'yandex', 'zoho'
+}
+
+# Job titles such as "Senior Backend Engineer" or "data scientist". "Manager" and
+# "lead" are left out: as plain words they would be templated out all over a draft.
+ROLE_TITLE = re.compile(
+    r"\b(?:[A-Z][\w+#./-]*\s+){0,3}"
+    r"(?i:engineer|developer|scientist|analyst|architect|designer|consultant|intern|researcher)s?\b"
+)
+
+# Per-request values in a cached draft, replaced by placeholders and filled in on reuse.
+# The full name comes first so "Dear Jane Smith" is not left as "Dear <name> Smith".
+FIELDS = ('full_name', 'name', 'surname', 'company', 'role')
+MASKS = {'full_name': '<name>', 'name': '<name>', 'surname': '<name>', 'company': '<company>', 'role': '<role>'}
+PLACEHOLDERS = {
+    'full_name': '[[recipient_full_name]]',
+    'name': '[[recipient_name]]',
+    'surname': '[[recipient_surname]]',
+    'company': '[[company]]',
+    'role': '[[role]]'
+}
+NAME_FIELDS = ('full_name', 'name', 'surname')
+COMPANY_SUFFIX = r"(?:,?\s+(?:Corporation|Corp|Inc|Ltd|LLC|GmbH|Co)\b)?"
+
+# A draft is only cached when these were all found in the request; otherwise it may
+# quote a name, company or role we could not template out
+REQUIRED_FIELDS = ('name', 'company', 'role')
+
+# Only the start of a request is embedded; the ask is almost always there
+REQUEST_MAX_TOKENS = 128
+
+
+def request_fields(email):
+    """Sender-specific values of a request: full name, first name, surname, company and role (each may be None)"""
+    display_name, address = parseaddr(email.get('sender', ''))
+    display_name = display_name.strip().strip('"')
+    text = f"{email.get('subject', '')}\n{email.get('body', '')}"
+    
+    full_name = name = surname = None
+    if display_name and '@' not in display_name:
+        tokens = display_name.split()
+        name = tokens[0]
+        if len(tokens) > 1:
+            full_name, surname = display_name, tokens[-1]
+    
+    company = None
+    domain = address.rsplit('@', 1)[-1].lower() if '@' in address else ''
+    labels = domain.split('.')
+    if len(labels) >= 2 and labels[-2] not in FREE_MAIL_DOMAINS:
+        # Use the spelling from the email when it appears there ("Acme" rather than "acme")
+        match = re.search(rf"\b{re.escape(labels[-2])}\b", text, re.IGNORECASE)
+        company = match.group(0) if match else labels[-2].capitalize()
+    
+    match = ROLE_TITLE.search(text)
+    role = match.group(0) if match else None
+    
+    return {'full_name': full_name, 'name': name, 'surname': surname, 'company': company, 'role': role}
+
+
+def sender_identifiers(email):
+    """Strings that identify the sender: (display-name words, company and domain names)"""
+    display_name, address = parseaddr(email.get('sender', ''))
+    names = [word for word in re.findall(r"[^\W\d_][\w'-]*", display_name) if len(word) > 1]
+    domain = address.rsplit('@', 1)[-1].lower() if '@' in address else ''
+    labels = [label for label in domain.split('.')[:-1] if len(label) > 1 and label not in FREE_MAIL_DOMAINS]
+    others = labels + ([domain] if labels else [])
+    company = request_fields(email)['company']
+    if company:
+        others.append(company)
+    return names, others
+
+
+def mask_fields(text, fields, masks):
+    """Replace every whole-word occurrence of each field value with its mask"""
+    for field in FIELDS:
+        value = fields.get(field)
+        if value:
+            # Names are matched with their case so "Will" does not also replace "will"
+            flags = 0 if field in NAME_FIELDS else re.IGNORECASE
+            # A legal suffix goes with the company, so "Acme Corp" never becomes "Globex Corp"
+            suffix = COMPANY_SUFFIX if field == 'company' else ''
+            text = re.sub(rf"\b{re.escape(value)}\b{suffix}", masks[field], text, flags=flags)
+    return text
+
+
+def detected_fields(fields):
+    """Comma-separated names of the fields that have a value, such as name,company,role"""
+    return ','.join(field for field in FIELDS if fields.get(field))
+
+
+def source_fingerprint():
+    """Hash of everything a draft is written from: the profile, reply settings and RAG documents"""
+    digest = hashlib.sha256()
+    for path in (PROFILE_PATH, CONFIG_PATH):
+        try:
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+        except OSError:
+            digest.update(b'missing')
+    # Documents are compared by size and modification time rather than read in full
+    for root, dirs, files in os.walk(RAG_DATA_PATH):
+        dirs.sort()
+        for filename in sorted(files):
+            path = os.path.join(root, filename)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            digest.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns}".encode('utf-8'))
+    return digest.hexdigest()
+
+
+class ReplyDraftCache:
+    """Reuses auto-reply drafts across near-identical requests.
+    
+    A request is embedded with the sender's name, company and role masked out, so
+    two recruiters asking for a resume in similar words map to nearby vectors. A
+    stored draft has the same fields replaced by placeholders; on a hit they are
+    filled in with the new sender's values. Drafts are only stored when every
+    field in REQUIRED_FIELDS was found and no other word of the sender's name,
+    company or domain is left in the template, and only reused for a request in
+    which the same fields were found. Drafts are dropped after ttl seconds and whenever
+    the profile, reply settings or RAG documents change.
+    """
+    
+    def __init__(self, embedding_model=None, path=REPLY_DRAFT_CACHE_PATH, threshold=REPLY_DRAFT_SIMILARITY_THRESHOLD,
+                 ttl=REPLY_DRAFT_TTL_SECONDS, max_entries=REPLY_DRAFT_MAX_ENTRIES):
+        self.embedding_model = embedding_model
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = []  # (reply_type, embedding, template, fields, created_at), oldest first
+        self.fingerprint = source_fingerprint()
+        self.hits = 0
+        self.misses = 0
+        
+        self.conn = None
+        if path:
+            self.conn = open_database(path, SCHEMA, 'reply draft cache', setup=self._load, memory_fallback=False)
+    
+    def _load(self, conn):
+        with self.lock:
+            conn.execute(
+                "DELETE FROM reply_drafts WHERE fingerprint != ? OR created_at < ?",
+                (self.fingerprint, time.time() - self.ttl)
+            )
+            rows = conn.execute(
+                "SELECT reply_type, embedding, template, fields, created_at FROM reply_drafts ORDER BY created_at"
+            ).fetchall()
+            self.entries = [
+                (reply_type, json.loads(embedding), template, fields, created_at)
+                for reply_type, embedding, template, fields, created_at in rows
+            ][-self.max_entries:]
+    
+    def describe(self, email):
+        """Fields and masked-request embedding of an email, for lookup() and store()"""
+        fields = request_fields(email)
+        text = f"{email.get('subject', '')}\n{compact_text(email.get('body', ''))}"
+        text = truncate_to_tokens(mask_fields(text, fields, MASKS), REQUEST_MAX_TOKENS)
+        # Without an explicit model the shared RAG model is used, loaded on first use
+        embedding_model = self.embedding_model or get_rag_resources().embedding_model()
+        embedding = embedding_model.encode(text, convert_to_numpy=True, normalize_embeddings=True)
+        return {'fields': fields, 'identifiers': sender_identifiers(email), 'embedding': [float(x) for x in embedding]}
+    
+    def lookup(self, reply_type, request):
+        """Cached draft personalized for request, or None if no close enough draft fits it"""
+        self._check_sources()
+        now = time.time()
+        fields = detected_fields(request['fields'])
+        best_similarity, best_template = -1.0, None
+        with self.lock:
+            for entry_type, embedding, template, entry_fields, created_at in self.entries:
+                # A draft written with a full name or company can't be reused for a request
+                # without one, and one written without may quote the original sender's
+                if entry_type != reply_type or entry_fields != fields or now - created_at >= self.ttl:
+                    continue
+                similarity = sum(a * b for a, b in zip(embedding, request['embedding']))
+                if similarity > best_similarity:
+                    best_similarity, best_template = similarity, template
+            
+            if best_template is not None and best_similarity >= self.threshold:
+                self.hits += 1
+                return self._personalize(best_template, request['fields'])
+            self.misses += 1
+        return None
+    
+    def store(self, reply_type, request, reply_body):
+        """Cache a freshly generated draft with its sender-specific values templated out"""
+        fields = request['fields']
+        if not all(fields.get(field) for field in REQUIRED_FIELDS):
+            return
+        template = mask_fields(reply_body, fields, PLACEHOLDERS)
+        leaked = self._leaked_identifier(template, request['identifiers'])
+        if leaked:
+            print(f"[ReplyDraftCache] Not caching a draft that still mentions '{leaked}'")
+            return
+        detected = detected_fields(fields)
+        now = time.time()
+        with self.lock:
+            self.entries.append((reply_type, request['embedding'], template, detected, now))
+            del self.entries[:-self.max_entries]
+            if self.conn is None:
+                return
+            try:
+                self.conn.execute(
+                    "INSERT INTO reply_drafts (reply_type, fingerprint, embedding, template, fields, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (reply_type, self.fingerprint, json.dumps(request['embedding']), template, detected, now)
+                )
+                self.conn.execute("""
+                    DELETE FROM reply_drafts WHERE id NOT IN (
+                        SELECT id FROM reply_drafts ORDER BY created_at DESC LIMIT ?
+                    )
+                """, (self.max_entries,))
+                self.conn.commit()
+            except sqlite3.Error as e:
+                print(f"Error saving reply draft: {e}")
+    
+    def _leaked_identifier(self, template, identifiers):
+        """The first sender name, company or domain left in a template, or None"""
+        names, others = identifiers
+        for value in names:
+            if re.search(rf"\b{re.escape(value)}\b", template):
+                return value
+        for value in others:
+            if re.search(rf"\b{re.escape(value)}\b", template, re.IGNORECASE):
+                return value
+        return None
+    
+    def _personalize(self, template, fields):
+        for field in FIELDS:
+            if fields.get(field):
+                template = template.replace(PLACEHOLDERS[field], fields[field])
+        return template
+    
+    def _check_sources(self):
+        fingerprint = source_fingerprint()
+        if fingerprint == self.fingerprint:
+            return
+        print("[ReplyDraftCache] Profile or RAG documents changed, dropping cached drafts")
+        with self.lock:
+            self.fingerprint = fingerprint
+            self.entries = []
+            if self.conn is not None:
+                try:
+                    self.conn.execute("DELETE FROM reply_drafts")
+                    self.conn.commit()
+                except sqlite3.Error as e:
+                    print(f"Error clearing reply drafts: {e}")
+    
+    def stats(self):
+        """Hit counters for monitoring"""
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 3) if total else 0.0,
+                'entries': len(self.entries),
+                'threshold': self.threshold
+            }
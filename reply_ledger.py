@@ -0,0 +1,143 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from db_utils import open_database, process_singleton
+from config import REPLY_LEDGER_PATH, AUTO_REPLY_THREAD_COOLDOWN_HOURS, REPLY_LEDGER_RETENTION_DAYS
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reply_ledger (
+    message_id TEXT PRIMARY KEY,
+    thread_id TEXT,
+    outcome TEXT NOT NULL,
+    reply_hash TEXT,
+    outbox_id INTEGER,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_reply_ledger_thread ON reply_ledger(thread_id, created_at);
+"""
+
+class ReplyLedger:
+    """Persistent record of every email the auto-reply stage has handled.
+    
+    Outcomes: queued (the reply is in the outbox), replied (the outbox sent it),
+    skipped (excluded or no request found), cooldown (the thread was replied to
+    recently), deferred (another email of the thread was being answered) and
+    failed. Queued, replied, skipped and cooldown are final, so the email is never
+    looked at again; deferred and failed emails are handed back by retry_ids(),
+    since Gmail only reports them as new mail once. A queued reply already puts
+    its thread in cooldown. The whole ledger is mirrored in memory, making both
+    checks dictionary lookups.
+    """
+    
+    FINAL_OUTCOMES = ('queued', 'replied', 'skipped', 'cooldown')
+    REPLY_OUTCOMES = ('queued', 'replied')
+    
+    def __init__(self, path=REPLY_LEDGER_PATH, cooldown_hours=AUTO_REPLY_THREAD_COOLDOWN_HOURS,
+                 retention_days=REPLY_LEDGER_RETENTION_DAYS):
+        self.cooldown = cooldown_hours * 3600
+        self.lock = threading.Lock()
+        self.outcomes = {}     # message_id -> outcome
+        self.last_reply = {}   # thread_id -> time of the latest reply
+        
+        # Replies are kept for the whole cooldown even if retention is shorter
+        cutoff = time.time() - max(retention_days * 86400, self.cooldown)
+        self.conn = open_database(
+            path, SCHEMA, 'reply ledger',
+            setup=lambda conn: conn.execute("DELETE FROM reply_ledger WHERE created_at < ?", (cutoff,))
+        )
+        
+        with self.lock:
+            for message_id, thread_id, outcome, created_at in self.conn.execute(
+                    "SELECT message_id, thread_id, outcome, created_at FROM reply_ledger"):
+                self.outcomes[message_id] = outcome
+                if outcome in self.REPLY_OUTCOMES and created_at > self.last_reply.get(thread_id, 0):
+                    self.last_reply[thread_id] = created_at
+    
+    def check(self, email):
+        """Reason to skip an email ('processed' or 'cooldown'), or None if it may be handled"""
+        with self.lock:
+            if self.outcomes.get(email['id']) in self.FINAL_OUTCOMES:
+                return 'processed'
+            replied_at = self.last_reply.get(email.get('thread_id', email['id']))
+            if replied_at is not None and time.time() - replied_at < self.cooldown:
+                return 'cooldown'
+        return None
+    
+    def record(self, email, outcome, reply_body=None, outbox_id=None):
+        """Record how an email was handled; a queued reply keeps its hash and outbox id once sent"""
+        now = time.time()
+        thread_id = email.get('thread_id', email['id'])
+        reply_hash = hashlib.sha256(reply_body.encode('utf-8')).hexdigest() if reply_body else None
+        with self.lock:
+            self.outcomes[email['id']] = outcome
+            try:
+                row = self.conn.execute(
+                    "SELECT reply_hash, outbox_id, attempts FROM reply_ledger WHERE message_id = ?", (email['id'],)
+                ).fetchone()
+                attempts = row[2] if row else 0
+                if outcome == 'failed':
+                    attempts += 1
+                if outcome == 'replied' and reply_hash is None and row:
+                    reply_hash, outbox_id = row[0], row[1]
+                self.conn.execute("""
+                    INSERT OR REPLACE INTO reply_ledger
+                        (message_id, thread_id, outcome, reply_hash, outbox_id, attempts, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, (email['id'], thread_id, outcome, reply_hash, outbox_id, attempts, now))
+                self.conn.commit()
+            except sqlite3.Error as e:
+                print(f"Error saving reply ledger entry: {e}")
+            
+            if outcome in self.REPLY_OUTCOMES:
+                self.last_reply[thread_id] = now
+            elif outcome == 'failed':
+                # A reply that never went out must not keep its thread in cooldown
+                self._reset_cooldown(thread_id)
+    
+    def queued(self):
+        """(message_id, thread_id, outbox_id) of every reply still waiting in the outbox"""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT message_id, thread_id, outbox_id FROM reply_ledger WHERE outcome = 'queued' ORDER BY created_at"
+            ).fetchall()
+    
+    def retry_ids(self, max_attempts):
+        """Ids of deferred and failed emails with attempts left, oldest first"""
+        with self.lock:
+            return [row[0] for row in self.conn.execute("""
+                SELECT message_id FROM reply_ledger
+                WHERE outcome IN ('deferred', 'failed') AND attempts < ?
+                ORDER BY created_at
+            """, (max_attempts,))]
+    
+    def count_attempt(self, message_id):
+        """Use up one retry of a deferred or failed email without changing its outcome"""
+        with self.lock:
+            try:
+                self.conn.execute("UPDATE reply_ledger SET attempts = attempts + 1 WHERE message_id = ?", (message_id,))
+                self.conn.commit()
+            except sqlite3.Error as e:
+                print(f"Error saving reply ledger entry: {e}")
+    
+    def _reset_cooldown(self, thread_id):
+        """Recompute a thread's latest reply from the table (lock held)"""
+        try:
+            replied_at = self.conn.execute(
+                "SELECT MAX(created_at) FROM reply_ledger WHERE thread_id = ? AND outcome IN (?, ?)",
+                (thread_id, *self.REPLY_OUTCOMES)
+            ).fetchone()[0]
+        except sqlite3.Error:
+            return
+        if replied_at is None:
+            self.last_reply.pop(thread_id, None)
+        else:
+            self.last_reply[thread_id] = replied_at
+
+
+@process_singleton
+def get_reply_ledger():
+    """Process-wide reply ledger"""
+    return ReplyLedger()
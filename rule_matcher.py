@@ -0,0 +1,99 @@
+import re
+
+
+def normalize(phrase):
+    """Lower-case a phrase and collapse its whitespace, as rules are matched"""
+    return ' '.join(phrase.lower().split())
+
+
+class RuleMatcher:
+    """Finds every rule phrase in a text with one compiled regex.
+    
+    Rules are {category: [phrase, ...]}. The phrases are compiled into a single
+    pattern shaped like a prefix trie, so a scan costs time proportional to the
+    text length rather than to the number of rules. Matching ignores case and
+    treats any run of whitespace as one space. With word_boundaries, a phrase only
+    matches as whole words ('cv' does not match 'cvs'); without them it matches
+    anywhere, which suits sender addresses and domains.
+    """
+    
+    def __init__(self, rules, word_boundaries=True):
+        self.word_boundaries = word_boundaries
+        self.categories = {}  # normalized phrase -> categories it belongs to
+        for category, phrases in rules.items():
+            for phrase in phrases:
+                phrase = normalize(phrase)
+                if phrase:
+                    self.categories.setdefault(phrase, []).append(category)
+        self.pattern = self._compile(list(self.categories))
+    
+    def scan(self, text):
+        """Every (category, phrase) hit in text, in text order.
+        
+        At each position only the longest phrase starting there counts, so
+        'send your resume' is reported rather than also 'send your'.
+        """
+        if self.pattern is None or not text:
+            return []
+        hits = []
+        seen = set()
+        for match in self.pattern.finditer(text):
+            phrase = normalize(match.group(1))
+            for category in self.categories.get(phrase, []):
+                if (category, phrase) not in seen:
+                    seen.add((category, phrase))
+                    hits.append((category, phrase))
+        return hits
+    
+    def first(self, text, categories=None):
+        """First (category, phrase) hit, optionally limited to some categories, or None"""
+        for category, phrase in self.scan(text):
+            if categories is None or category in categories:
+                return category, phrase
+        return None
+    
+    def _compile(self, phrases):
+        if not phrases:
+            return None
+        
+        if self.word_boundaries:
+            # A start boundary only makes sense for phrases that start with a word character
+            word_start = [phrase for phrase in phrases if _is_word_char(phrase[0])]
+            other = [phrase for phrase in phrases if not _is_word_char(phrase[0])]
+            branches = []
+            if word_start:
+                branches.append(r'(?<!\w)' + self._trie_pattern(word_start))
+            if other:
+                branches.append(self._trie_pattern(other))
+            body = '|'.join(branches)
+        else:
+            body = self._trie_pattern(phrases)
+        
+        # The lookahead makes matches zero-width, so hits that overlap are all found
+        return re.compile(f'(?=({body}))', re.IGNORECASE)
+    
+    def _trie_pattern(self, phrases):
+        trie = {}
+        for phrase in phrases:
+            node = trie
+            for char in phrase:
+                node = node.setdefault(char, {})
+            node[''] = {}
+        return self._node_pattern(trie, None)
+    
+    def _node_pattern(self, node, previous_char):
+        alternatives = []
+        for char in sorted(key for key in node if key):
+            piece = r'\s+' if char == ' ' else re.escape(char)
+            alternatives.append(piece + self._node_pattern(node[char], char))
+        if '' in node:
+            # Ending here is tried last, so longer phrases win
+            end_boundary = self.word_boundaries and _is_word_char(previous_char)
+            alternatives.append(r'(?!\w)' if end_boundary else '')
+        if len(alternatives) == 1:
+            return alternatives[0]
+        return '(?:' + '|'.join(alternatives) + ')'
+
+
+def _is_word_char(char):
+    return char is not None and (char.isalnum() or char == '_')
@@ -5,6 +5,7 @@ Run this once to initialize the RAG system with your data
 """
 
 from subagents.rag_agent import RAGAgent
+from rag_resources import get_rag_resources
 from rag_loader import DocumentLoader
 import os
 
@@ -53,6 +54,9 @@ def setup_rag():
     print("\n" + "=" * 60)
     print(f"✓ RAG Database Setup Complete!")
     print(f"✓ Total documents loaded: {total_docs}")
+    for resource, state in get_rag_resources().report().items():
+        if state['loaded']:
+            print(f"✓ {resource.replace('_', ' ').capitalize()} loaded in {state['load_seconds']}s")
     print("=" * 60)
     
     # Test query
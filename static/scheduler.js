@@ -134,11 +134,6 @@ function initializeTimeSlots() {
         slot.className = 'time-slot';
         slot.textContent = time;
         
-        // Randomly mark some as unavailable (mock)
-        if (Math.random() > 0.8) {
-            slot.classList.add('unavailable');
-        }
-        
         slot.addEventListener('click', () => {
             if (!slot.classList.contains('unavailable')) {
                 document.querySelectorAll('.time-slot').forEach(s => s.classList.remove('selected'));
@@ -158,24 +153,64 @@ function initializeTimeSlots() {
         
         container.appendChild(slot);
     });
+    
+    updateTimeSlots(new Date());
 }
 
 function generateTimeSlots() {
     const slots = [];
     for (let hour = 9; hour <= 17; hour++) {
         for (let min = 0; min < 60; min += 30) {
-            const period = hour >= 12 ? 'PM' : 'AM';
-            const displayHour = hour > 12 ? hour - 12 : hour;
-            slots.push(`${displayHour}:${min.toString().padStart(2, '0')} ${period}`);
+            slots.push(formatSlotTime(hour, min));
         }
     }
     return slots;
 }
 
-function updateTimeSlots(date) {
-    // Refresh time slots based on selected date
-    // In a real app, this would fetch availability from backend
-    console.log('Selected date:', date);
+function formatSlotTime(hour, min) {
+    const period = hour >= 12 ? 'PM' : 'AM';
+    const displayHour = hour > 12 ? hour - 12 : hour;
+    return `${displayHour}:${min.toString().padStart(2, '0')} ${period}`;
+}
+
+function formatDateParam(date) {
+    const month = (date.getMonth() + 1).toString().padStart(2, '0');
+    const day = date.getDate().toString().padStart(2, '0');
+    return `${date.getFullYear()}-${month}-${day}`;
+}
+
+async function updateTimeSlots(date) {
+    // Mark the slots the backend reports as busy for the selected date
+    const params = new URLSearchParams({
+        start: formatDateParam(date),
+        duration: 30,
+        work_start: '09:00',
+        work_end: '18:00',
+        limit: 100,
+        timezone: Intl.DateTimeFormat().resolvedOptions().timeZone
+    });
+    
+    try {
+        const response = await fetch(`/api/availability?${params}`);
+        const data = await response.json();
+        if (!data.success) {
+            throw new Error(data.error);
+        }
+        
+        const free = new Set(data.slots.map(slot => {
+            const start = new Date(slot.start);
+            return formatSlotTime(start.getHours(), start.getMinutes());
+        }));
+        
+        document.querySelectorAll('.time-slot').forEach(slot => {
+            slot.classList.toggle('unavailable', !free.has(slot.textContent));
+            if (slot.classList.contains('unavailable')) {
+                slot.classList.remove('selected');
+            }
+        });
+    } catch (error) {
+        console.error('Error loading availability:', error);
+    }
 }
 
 // Modal
@@ -240,38 +275,56 @@ function handleCreateMeeting() {
 }
 
 // Meetings
-function loadUpcomingMeetings() {
+async function loadUpcomingMeetings() {
     const container = document.getElementById('upcomingMeetings');
     
-    // Mock data - in real app, fetch from backend
-    const mockMeetings = [
-        {
-            time: 'Today, 2:00 PM',
-            title: 'Product Review',
-            participants: '5 participants',
-            category: 'work'
-        },
-        {
-            time: 'Tomorrow, 10:30 AM',
-            title: 'Team Standup',
-            participants: '8 participants',
-            category: 'team'
-        },
-        {
-            time: 'Nov 20, 3:00 PM',
-            title: 'Client Meeting',
-            participants: '3 participants',
-            category: 'work'
+    try {
+        const response = await fetch('/api/meetings/upcoming?hours=72');
+        const data = await response.json();
+        if (!data.success) {
+            throw new Error(data.error);
+        }
+        
+        if (data.meetings.length === 0) {
+            container.innerHTML = '<div class="meeting-participants">No upcoming meetings</div>';
+            return;
         }
-    ];
-
-    container.innerHTML = mockMeetings.map(meeting => `
-        <div class="meeting-card" style="border-left-color: ${getCategoryColor(meeting.category)}">
-            <div class="meeting-time">${meeting.time}</div>
-            <div class="meeting-title">${meeting.title}</div>
-            <div class="meeting-participants">${meeting.participants}</div>
-        </div>
-    `).join('');
+        
+        // Calendar events carry no category, so they all use the work colour
+        container.innerHTML = data.meetings.map(meeting => `
+            <div class="meeting-card" style="border-left-color: ${getCategoryColor('work')}">
+                <div class="meeting-time">${formatMeetingTime(meeting.start)}</div>
+                <div class="meeting-title">${escapeHtml(meeting.title)}</div>
+                <div class="meeting-participants">${meeting.attendees} participant${meeting.attendees === 1 ? '' : 's'}</div>
+            </div>
+        `).join('');
+    } catch (error) {
+        console.error('Error loading meetings:', error);
+    }
+}
+
+function formatMeetingTime(start) {
+    // All-day events only have a date
+    const allDay = !start.includes('T');
+    const date = allDay ? new Date(`${start}T00:00:00`) : new Date(start);
+    const today = new Date();
+    const tomorrow = new Date(today.getFullYear(), today.getMonth(), today.getDate() + 1);
+    
+    let day;
+    if (date.toDateString() === today.toDateString()) {
+        day = 'Today';
+    } else if (date.toDateString() === tomorrow.toDateString()) {
+        day = 'Tomorrow';
+    } else {
+        day = date.toLocaleDateString('en-US', { month: 'short', day: 'numeric' });
+    }
+    return allDay ? `${day}, all day` : `${day}, ${formatSlotTime(date.getHours(), date.getMinutes())}`;
+}
+
+function escapeHtml(text) {
+    const div = document.createElement('div');
+    div.textContent = text;
+    return div.innerHTML;
 }
 
 function getCategoryColor(category) {
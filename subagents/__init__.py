@@ -1 +1 @@
-# Subagents package
+# Subagents package
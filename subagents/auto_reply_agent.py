@@ -1,312 +1,449 @@
-"""
-AutoReplyAgent - Fully Autonomous Email Response System
-
-This agent automatically detects and responds to RESUME/CV requests ONLY.
-No other keywords will trigger an auto-reply.
-
-Features:
-- Automatic keyword detection (ONLY: resume, cv, curriculum vitae)
-- AI-generated personalized responses using user profile
-- Thread-aware replies (responds in same email thread)
-- Configurable keywords, tone, and exclusions
-- Automatic email marking as read
-
-Configuration:
-- user_profile.json: Your professional information
-- auto_reply_config.json: Auto-reply settings and exclusions
-
-Usage:
-The agent runs automatically as part of the coordinator workflow.
-No manual action required - completely autonomous!
-
-IMPORTANT: Only replies to emails containing "resume", "cv", or "curriculum vitae"
-"""
-from subagents.rag_agent import RAGAgent
-from subagents.base_agent import BaseAgent
-from gmail_handler import GmailHandler
-import json
-import os
-
-
-class AutoReplyAgent(BaseAgent):
-    """Autonomous agent that automatically replies to resume/profile-related emails"""
-    
-    def __init__(self, gmail_service):
-        super().__init__("AutoReplyAgent", "Autonomous Email Auto-Reply Specialist")
-        self.gmail = GmailHandler(gmail_service)
-        self.user_profile = self._load_user_profile()
-        self.config = self._load_config()
-        self.rag_agent = RAGAgent()  # NEW
-    
-    def _load_user_profile(self):
-        """Load user profile data"""
-        try:
-            with open('user_profile.json', 'r') as f:
-                return json.load(f)
-        except Exception as e:
-            print(f"[{self.name}] Error loading user profile: {e}")
-            return {}
-    
-    def _load_config(self):
-        """Load auto-reply configuration"""
-        try:
-            with open('auto_reply_config.json', 'r') as f:
-                return json.load(f)
-        except Exception as e:
-            print(f"[{self.name}] Error loading config, using defaults: {e}")
-            return {
-                'enabled': True,
-                'auto_mark_as_read': True,
-                'keywords': {},
-                'response_settings': {},
-                'exclusions': {}
-            }
-    
-    def process(self, task):
-        """Process auto-reply tasks"""
-        task_type = task.get('type')
-        
-        if task_type == 'auto_reply':
-            return self._auto_reply_to_emails(task.get('emails', []))
-        else:
-            return {'error': f'Unknown task type: {task_type}'}
-    
-    def _auto_reply_to_emails(self, emails):
-        """Automatically detect and reply to resume/profile-related emails"""
-        # Check if auto-reply is enabled
-        if not self.config.get('enabled', True):
-            print(f"[{self.name}] Auto-reply is disabled in config")
-            return self.report_to_coordinator({
-                'replied': 0,
-                'skipped': len(emails),
-                'total': len(emails)
-            })
-        
-        print(f"[{self.name}] Analyzing {len(emails)} emails for auto-reply...")
-        
-        replied_count = 0
-        skipped_count = 0
-        
-        for email in emails:
-            # Check exclusions first
-            if self._is_excluded(email):
-                skipped_count += 1
-                continue
-            
-            # Check if this email needs an auto-reply
-            should_reply, reply_type = self._should_auto_reply(email)
-            
-            if should_reply:
-                print(f"[{self.name}] 🎯 Detected RESUME/CV request from {email['sender']}")
-                reply_sent = self._generate_and_send_reply(email, reply_type)
-                
-                if reply_sent:
-                    replied_count += 1
-                    # Mark as read after replying if configured
-                    if self.config.get('auto_mark_as_read', True):
-                        self.gmail.mark_as_read(email['id'])
-                    print(f"[{self.name}] ✓ Auto-replied to: {email['subject']}")
-                else:
-                    skipped_count += 1
-            else:
-                skipped_count += 1
-        
-        return self.report_to_coordinator({
-            'replied': replied_count,
-            'skipped': skipped_count,
-            'total': len(emails)
-        })
-    
-    def _is_excluded(self, email):
-        """Check if email should be excluded from auto-reply"""
-        exclusions = self.config.get('exclusions', {})
-        
-        # Check sender email
-        sender = email['sender'].lower()
-        excluded_emails = exclusions.get('sender_emails', [])
-        if any(excluded in sender for excluded in excluded_emails):
-            print(f"[{self.name}] ✗ Excluded: sender email matches exclusion list")
-            return True
-        
-        # Check sender domain
-        excluded_domains = exclusions.get('sender_domains', [])
-        if any(domain in sender for domain in excluded_domains):
-            print(f"[{self.name}] ✗ Excluded: sender domain matches exclusion list")
-            return True
-        
-        # Check subject keywords
-        subject = email['subject'].lower()
-        body = email['body'].lower()
-        excluded_keywords = exclusions.get('subject_keywords', [])
-        
-        # Check both subject and body for exclusion keywords
-        for keyword in excluded_keywords:
-            if keyword in subject or keyword in body:
-                print(f"[{self.name}] ✗ Excluded: contains keyword '{keyword}'")
-                return True
-        
-        # Additional automated email detection
-        automated_indicators = [
-            'do not reply',
-            'do-not-reply',
-            'automated message',
-            'automatic notification',
-            'this is an automated',
-            'unsubscribe',
-            'opt out',
-            'manage preferences',
-            'view in browser',
-            'click here to view'
-        ]
-        
-        combined = f"{subject} {body}"
-        for indicator in automated_indicators:
-            if indicator in combined:
-                print(f"[{self.name}] ✗ Excluded: automated email detected ('{indicator}')")
-                return True
-        
-        return False
-    
-    def _should_auto_reply(self, email):
-        """Determine if email requires auto-reply - ONLY for SPECIFIC resume/CV requests"""
-        subject = email['subject'].lower()
-        body = email['body'].lower()
-        combined_text = f"{subject} {body}"
-        
-        # STRICT: Must contain specific request phrases, not just the word "resume"
-        # This avoids newsletters, notifications, and generic mentions
-        request_phrases = [
-            'send your resume',
-            'share your resume',
-            'send your cv',
-            'share your cv',
-            'send me your resume',
-            'share me your resume',
-            'send me your cv',
-            'share me your cv',
-            'send resume',
-            'share resume',
-            'send cv',
-            'share cv',
-            'your resume',
-            'your cv',
-            'attach your resume',
-            'attach your cv',
-            'submit your resume',
-            'submit your cv',
-            'provide your resume',
-            'provide your cv',
-            'forward your resume',
-            'forward your cv',
-            'send us your resume',
-            'send us your cv',
-            'email your resume',
-            'email your cv',
-            'can you send your resume',
-            'can you send your cv',
-            'could you send your resume',
-            'could you send your cv',
-            'please send your resume',
-            'please send your cv',
-            'please share your resume',
-            'please share your cv',
-            'need your resume',
-            'need your cv',
-            'request your resume',
-            'request your cv',
-            'looking for your resume',
-            'looking for your cv'
-        ]
-        
-        # Check if email contains any specific request phrase
-        for phrase in request_phrases:
-            if phrase in combined_text:
-                print(f"[{self.name}] ✓ Matched request phrase: '{phrase}'")
-                return True, 'resume'
-        
-        # If just contains "resume" or "cv" without a request context, ignore it
-        # This filters out newsletters, job postings, etc.
-        print(f"[{self.name}] ✗ No specific resume/CV request detected (avoiding newsletters/generic mentions)")
-        return False, None
-    
-    def _generate_and_send_reply(self, email, reply_type):
-        try:
-            context = self._prepare_context(reply_type, email)
-            
-            # Get response settings from config
-            response_settings = self.config.get('response_settings', {})
-            tone = response_settings.get('tone', 'professional and friendly')
-            max_words = response_settings.get('max_words', 300)
-            signature = response_settings.get('signature', 'Best regards')
-            
-            # Generate reply using Gemini
-            prompt = f"""You are an AI assistant helping to respond to a professional email.
-
-Original Email:
-From: {email['sender']}
-Subject: {email['subject']}
-Body: {email['body'][:500]}
-
-User Profile Information:
-{context}
-
-Task: Generate a {tone} email reply that:
-1. Thanks them for reaching out
-2. Provides the requested information about {reply_type}
-3. Includes relevant details from the user profile
-4. Offers to provide more information if needed
-5. Maintains a {tone} tone
-
-IMPORTANT: 
-- Keep the response concise (maximum {max_words} words)
-- Format it as a complete email body (no subject line needed)
-- Be specific and highlight key strengths
-- End with "{signature}"
-
-Generate the email body only:"""
-            
-            reply_body = self.generate_with_retry(prompt)
-            
-            # Generate subject line
-            subject = f"Re: {email['subject']}"
-            
-            # Send the reply
-            self.gmail.send_email(
-                to=email['sender'],
-                subject=subject,
-                body=reply_body,
-                thread_id=email.get('thread_id')
-            )
-            
-            return True
-            
-        except Exception as e:
-            print(f"[{self.name}] Error generating/sending reply: {e}")
-            return False
-    
-    def _prepare_context(self, reply_type, email=None):
-        """Prepare context with RAG enhancement"""
-        profile = self.user_profile
-        
-        # Base context from profile
-        base_context = f"""
-Personal Information:
-- Name: {profile.get('personal_info', {}).get('name', 'N/A')}
-- Email: {profile.get('personal_info', {}).get('email', 'N/A')}
-- LinkedIn: {profile.get('personal_info', {}).get('linkedin', 'N/A')}
-- GitHub: {profile.get('personal_info', {}).get('github', 'N/A')}
-
-Professional Summary:
-{profile.get('professional_summary', 'N/A')}
-"""
-        
-        # NEW: Query RAG for additional context
-        if email:
-            query = f"{email['subject']} {email['body'][:200]}"
-            rag_results = self.rag_agent.query(query, n_results=3)
-            
-            if rag_results:
-                rag_context = "\n\n".join(rag_results)
-                base_context += f"\n\nAdditional Relevant Information:\n{rag_context}"
-        
+"""
+AutoReplyAgent - Fully Autonomous Email Response System
+
+This agent automatically detects and responds to RESUME/CV requests ONLY.
+No other keywords will trigger an auto-reply.
+
+Features:
+- Automatic keyword detection (ONLY: resume, cv, curriculum vitae)
+- AI-generated personalized responses using user profile
+- Thread-aware replies (responds in same email thread)
+- Configurable keywords, tone, and exclusions
+- Automatic email marking as read
+
+Configuration:
+- user_profile.json: Your professional information
+- auto_reply_config.json: Auto-reply settings and exclusions
+
+Usage:
+The agent runs automatically as part of the coordinator workflow.
+No manual action required - completely autonomous!
+
+IMPORTANT: Only replies to emails containing "resume", "cv", or "curriculum vitae"
+"""
+from subagents.rag_agent import RAGAgent
+from subagents.base_agent import BaseAgent
+from gmail_handler import GmailHandler
+from prompt_compactor import compact_emails
+from config import PROMPT_REPLY_EMAIL_TOKENS, AUTO_REPLY_WORKERS, AUTO_REPLY_MAX_PENDING, AUTO_REPLY_MAX_ATTEMPTS
+from rule_matcher import RuleMatcher
+from reply_ledger import get_reply_ledger
+from reply_drafts import ReplyDraftCache
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import threading
+
+
+class AutoReplyAgent(BaseAgent):
+    """Autonomous agent that automatically replies to resume/profile-related emails"""
+    
+    # Every reply is written for its own email, so identical prompts are not served from the cache
+    use_cache = False
+    
+    # Built-in request phrases, used only when auto_reply_config.json has none,
+    # so a missing or unreadable config never turns auto-reply off
+    DEFAULT_REQUEST_PHRASES = {
+        'resume': [
+            'send your resume',
+            'share your resume',
+            'send your cv',
+            'share your cv',
+            'send me your resume',
+            'share me your resume',
+            'send me your cv',
+            'share me your cv',
+            'send resume',
+            'share resume',
+            'send cv',
+            'share cv',
+            'your resume',
+            'your cv',
+            'attach your resume',
+            'attach your cv',
+            'submit your resume',
+            'submit your cv',
+            'provide your resume',
+            'provide your cv',
+            'forward your resume',
+            'forward your cv',
+            'send us your resume',
+            'send us your cv',
+            'email your resume',
+            'email your cv',
+            'can you send your resume',
+            'can you send your cv',
+            'could you send your resume',
+            'could you send your cv',
+            'please send your resume',
+            'please send your cv',
+            'please share your resume',
+            'please share your cv',
+            'need your resume',
+            'need your cv',
+            'request your resume',
+            'request your cv',
+            'looking for your resume',
+            'looking for your cv'
+        ]
+    }
+    
+    def __init__(self, gmail_service):
+        super().__init__("AutoReplyAgent", "Autonomous Email Auto-Reply Specialist")
+        self.gmail = GmailHandler(gmail_service)
+        self.user_profile = self._load_user_profile()
+        self.config = self._load_config()
+        self._compile_rules()
+        self.ledger = get_reply_ledger()
+        self.rag_agent = RAGAgent()  # NEW
+        self.draft_cache = ReplyDraftCache()
+    
+    def _load_user_profile(self):
+        """Load user profile data"""
+        try:
+            with open('user_profile.json', 'r') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"[{self.name}] Error loading user profile: {e}")
+            return {}
+    
+    def _load_config(self):
+        """Load auto-reply configuration"""
+        try:
+            with open('auto_reply_config.json', 'r') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"[{self.name}] Error loading config, using defaults: {e}")
+            return {
+                'enabled': True,
+                'auto_mark_as_read': True,
+                'keywords': {},
+                'request_phrases': {},
+                'response_settings': {},
+                'exclusions': {}
+            }
+    
+    def _compile_rules(self):
+        """Compile the config's phrase lists into matchers that scan each text once"""
+        exclusions = self.config.get('exclusions', {})
+        # Sender rules are address fragments ('noreply@', 'mailer'), so they match anywhere
+        self.sender_matcher = RuleMatcher({
+            'sender_emails': exclusions.get('sender_emails', []),
+            'sender_domains': exclusions.get('sender_domains', [])
+        }, word_boundaries=False)
+        self.exclusion_matcher = RuleMatcher({
+            'keyword': exclusions.get('subject_keywords', []),
+            'automated': exclusions.get('automated_indicators', [])
+        })
+        # Each request_phrases category is the reply type its phrases trigger
+        self.request_matcher = RuleMatcher(self.config.get('request_phrases') or self.DEFAULT_REQUEST_PHRASES)
+    
+    def process(self, task):
+        """Process auto-reply tasks"""
+        task_type = task.get('type')
+        
+        if task_type == 'auto_reply':
+            return self._auto_reply_to_emails(task.get('emails', []))
+        else:
+            return {'error': f'Unknown task type: {task_type}'}
+    
+    def _auto_reply_to_emails(self, emails):
+        """Automatically detect and reply to resume/profile-related emails"""
+        # Check if auto-reply is enabled
+        if not self.config.get('enabled', True):
+            print(f"[{self.name}] Auto-reply is disabled in config")
+            return self.report_to_coordinator({
+                'replied': 0,
+                'skipped': len(emails),
+                'total': len(emails)
+            })
+        
+        # Replies queued in earlier cycles count once the outbox has sent them
+        replied_count = self._confirm_sent_replies()
+        queued_count = 0
+        skipped_count = 0
+        
+        # Failed and deferred requests never come back as new mail, so the ledger
+        # feeds them back in, ahead of the new emails
+        emails = self._with_retries(emails)
+        
+        print(f"[{self.name}] Analyzing {len(emails)} emails for auto-reply...")
+        
+        # The ledger is checked before anything else, so handled emails and threads
+        # replied to recently cost neither a body fetch nor a Gemini call
+        candidates = []
+        for email in emails:
+            reason = self.ledger.check(email)
+            if reason == 'cooldown':
+                print(f"[{self.name}] ✗ Skipped: thread was auto-replied to recently")
+                self.ledger.record(email, 'cooldown')
+            elif reason is None:
+                # Sender/subject exclusions run first so bodies are only fetched for the survivors
+                if self._is_excluded_by_headers(email):
+                    self.ledger.record(email, 'skipped')
+                else:
+                    candidates.append(email)
+        self.gmail.load_bodies(candidates)
+        candidate_ids = {email['id'] for email in candidates}
+        
+        # Classification is cheap and runs in order, so which email of a thread gets
+        # the reply never depends on timing
+        selected = []
+        selected_threads = set()
+        for email in emails:
+            if email['id'] not in candidate_ids:
+                skipped_count += 1
+                continue
+            
+            # Check body exclusions
+            if self._is_excluded_by_body(email):
+                self.ledger.record(email, 'skipped')
+                skipped_count += 1
+                continue
+            
+            # Check if this email needs an auto-reply
+            should_reply, reply_type = self._should_auto_reply(email)
+            
+            if should_reply:
+                print(f"[{self.name}] 🎯 Detected RESUME/CV request from {email['sender']}")
+                # Only the first request in a thread is answered this cycle. The others are
+                # deferred: retried next cycle, they hit the cooldown, or get their turn
+                # if this reply failed
+                thread_id = email.get('thread_id', email['id'])
+                if thread_id in selected_threads:
+                    print(f"[{self.name}] ✗ Deferred: thread already has a reply in progress")
+                    self.ledger.record(email, 'deferred')
+                    skipped_count += 1
+                    continue
+                selected_threads.add(thread_id)
+                selected.append((email, reply_type))
+            else:
+                self.ledger.record(email, 'skipped')
+                skipped_count += 1
+        
+        # Context retrieval, generation and queueing run concurrently; results are
+        # handled in input order so the report and ledger are deterministic
+        for email, queued in self._run_reply_pipeline(selected):
+            if queued:
+                reply_body, outbox_id = queued
+                # Only marked replied (and read) once the outbox reports it sent
+                self.ledger.record(email, 'queued', reply_body, outbox_id)
+                queued_count += 1
+                print(f"[{self.name}] ✓ Auto-reply queued for: {email['subject']}")
+            else:
+                self.ledger.record(email, 'failed')
+                skipped_count += 1
+        
+        return self.report_to_coordinator({
+            'replied': replied_count,
+            'queued': queued_count,
+            'skipped': skipped_count,
+            'total': len(emails)
+        })
+    
+    def _with_retries(self, emails):
+        """emails preceded by the deferred and failed requests the ledger wants retried"""
+        new_ids = {email['id'] for email in emails}
+        retry_ids = [msg_id for msg_id in self.ledger.retry_ids(AUTO_REPLY_MAX_ATTEMPTS) if msg_id not in new_ids]
+        if not retry_ids:
+            return emails
+        retries, errors = self.gmail.fetch_email_details(retry_ids)
+        # An email that can't be fetched (e.g. deleted) still uses up a retry, so it is
+        # dropped after AUTO_REPLY_MAX_ATTEMPTS cycles instead of being fetched every cycle
+        for msg_id, error in errors.items():
+            print(f"[{self.name}] Could not fetch {msg_id} for a retry: {error}")
+            self.ledger.count_attempt(msg_id)
+        print(f"[{self.name}] Retrying {len(retries)} failed or deferred request(s)")
+        return retries + list(emails)
+    
+    def _confirm_sent_replies(self):
+        """Settle queued replies the outbox has finished with; returns how many were sent"""
+        sent_count = 0
+        for message_id, thread_id, outbox_id in self.ledger.queued():
+            email = {'id': message_id, 'thread_id': thread_id}
+            status = self.gmail.get_send_status(outbox_id) if outbox_id is not None else None
+            # An unknown id means the queue was lost (in-memory outbox on Vercel)
+            state = status['status'] if status else 'failed'
+            if state == 'sent':
+                self.ledger.record(email, 'replied')
+                self.gmail.store.mark([message_id], 'auto_replied')
+                # Mark as read after replying if configured (applied in bulk at the end of the cycle)
+                if self.config.get('auto_mark_as_read', True):
+                    self.gmail.defer_mark_as_read(message_id)
+                sent_count += 1
+            elif state == 'failed':
+                error = status.get('last_error') if status else 'no longer in the outbox'
+                print(f"[{self.name}] ✗ Auto-reply to {message_id} was not sent: {error}")
+                self.ledger.record(email, 'failed')
+        return sent_count
+    
+    def _run_reply_pipeline(self, selected):
+        """Generate and queue replies on a bounded worker pool; returns [(email, (reply_body, outbox_id) or None)] in input order"""
+        if len(selected) <= 1:
+            return [(email, self._generate_and_send_reply(email, reply_type)) for email, reply_type in selected]
+        
+        print(f"[{self.name}] Generating {len(selected)} replies with up to {AUTO_REPLY_WORKERS} workers...")
+        # Backpressure: no more than AUTO_REPLY_MAX_PENDING replies are submitted at once
+        pending_slots = threading.BoundedSemaphore(AUTO_REPLY_MAX_PENDING)
+        futures = []
+        with ThreadPoolExecutor(max_workers=AUTO_REPLY_WORKERS, thread_name_prefix='AutoReply') as pool:
+            for email, reply_type in selected:
+                pending_slots.acquire()
+                future = pool.submit(self._generate_and_send_reply, email, reply_type)
+                future.add_done_callback(lambda _: pending_slots.release())
+                futures.append((email, future))
+            return [(email, future.result()) for email, future in futures]
+    
+    def _is_excluded(self, email):
+        """Check if email should be excluded from auto-reply"""
+        # Sender and subject checks first, so the body is only read when they pass
+        return self._is_excluded_by_headers(email) or self._is_excluded_by_body(email)
+    
+    def _is_excluded_by_body(self, email):
+        """Exclusion checks that need the email body"""
+        return self._is_excluded_by_text(email['body'])
+    
+    def _is_excluded_by_headers(self, email):
+        """Exclusion checks that only need the sender and subject"""
+        hit = self.sender_matcher.first(email['sender'])
+        if hit:
+            kind = 'email' if hit[0] == 'sender_emails' else 'domain'
+            print(f"[{self.name}] ✗ Excluded: sender {kind} matches exclusion list ('{hit[1]}')")
+            return True
+        
+        return self._is_excluded_by_text(email['subject'])
+    
+    def _is_excluded_by_text(self, text):
+        hit = self.exclusion_matcher.first(text)
+        if not hit:
+            return False
+        if hit[0] == 'automated':
+            print(f"[{self.name}] ✗ Excluded: automated email detected ('{hit[1]}')")
+        else:
+            print(f"[{self.name}] ✗ Excluded: contains keyword '{hit[1]}'")
+        return True
+    
+    def _should_auto_reply(self, email):
+        """Determine if email requires auto-reply - ONLY for SPECIFIC resume/CV requests"""
+        combined_text = f"{email['subject']} {email['body']}"
+        
+        # STRICT: Must contain specific request phrases, not just the word "resume"
+        # This avoids newsletters, notifications, and generic mentions
+        hit = self.request_matcher.first(combined_text)
+        if hit:
+            reply_type, phrase = hit
+            print(f"[{self.name}] ✓ Matched request phrase: '{phrase}'")
+            return True, reply_type
+        
+        # If just contains "resume" or "cv" without a request context, ignore it
+        # This filters out newsletters, job postings, etc.
+        print(f"[{self.name}] ✗ No specific resume/CV request detected (avoiding newsletters/generic mentions)")
+        return False, None
+    
+    def _generate_and_send_reply(self, email, reply_type):
+        """Generate and queue a reply; returns (reply_body, outbox_id), or None on failure"""
+        try:
+            # Near-identical requests reuse an earlier draft, skipping the RAG query and Gemini call
+            request = self._describe_request(email)
+            reply_body = self.draft_cache.lookup(reply_type, request) if request else None
+            if reply_body:
+                print(f"[{self.name}] ♻ Reused a cached draft for {email['sender']}")
+            else:
+                reply_body = self._write_reply(email, reply_type)
+                if request:
+                    self.draft_cache.store(reply_type, request, reply_body)
+            
+            # Generate subject line
+            subject = f"Re: {email['subject']}"
+            
+            # Queue the reply - the outbox sends it in the background
+            outbox_id = self.gmail.queue_email(
+                to=email['sender'],
+                subject=subject,
+                body=reply_body,
+                thread_id=email.get('thread_id')
+            )
+            
+            return reply_body, outbox_id
+            
+        except Exception as e:
+            print(f"[{self.name}] Error generating/sending reply: {e}")
+            return None
+    
+    def _write_reply(self, email, reply_type):
+        """Write a reply to email with Gemini, from the profile and RAG context"""
+        context = self._prepare_context(reply_type, email)
+        
+        # Get response settings from config
+        response_settings = self.config.get('response_settings', {})
+        tone = response_settings.get('tone', 'professional and friendly')
+        max_words = response_settings.get('max_words', 300)
+        signature = response_settings.get('signature', 'Best regards')
+        
+        # Only the new text of the email is sent - quoted history and signatures are stripped
+        (body,), stats = compact_emails([email['body']], PROMPT_REPLY_EMAIL_TOKENS)
+        if stats['tokens_saved']:
+            print(f"[{self.name}] Compacted email: {stats['tokens_before']} -> {stats['tokens_after']} tokens")
+        
+        # Generate reply using Gemini
+        prompt = f"""You are an AI assistant helping to respond to a professional email.
+
+Original Email:
+From: {email['sender']}
+Subject: {email['subject']}
+Body: {body}
+
+User Profile Information:
+{context}
+
+Task: Generate a {tone} email reply that:
+1. Thanks them for reaching out
+2. Provides the requested information about {reply_type}
+3. Includes relevant details from the user profile
+4. Offers to provide more information if needed
+5. Maintains a {tone} tone
+
+IMPORTANT: 
+- Keep the response concise (maximum {max_words} words)
+- Format it as a complete email body (no subject line needed)
+- Be specific and highlight key strengths
+- End with "{signature}"
+
+Generate the email body only:"""
+        
+        return self.generate_with_retry(prompt)
+    
+    def _describe_request(self, email):
+        """Masked-request embedding for the draft cache, or None if it can't be computed"""
+        try:
+            return self.draft_cache.describe(email)
+        except Exception as e:
+            print(f"[{self.name}] Error embedding request for draft cache: {e}")
+            return None
+    
+    def _prepare_context(self, reply_type, email=None):
+        """Prepare context with RAG enhancement"""
+        profile = self.user_profile
+        
+        # Base context from profile
+        base_context = f"""
+Personal Information:
+- Name: {profile.get('personal_info', {}).get('name', 'N/A')}
+- Email: {profile.get('personal_info', {}).get('email', 'N/A')}
+- LinkedIn: {profile.get('personal_info', {}).get('linkedin', 'N/A')}
+- GitHub: {profile.get('personal_info', {}).get('github', 'N/A')}
+
+Professional Summary:
+{profile.get('professional_summary', 'N/A')}
+"""
+        
+        # NEW: Query RAG for additional context
+        if email:
+            query = f"{email['subject']} {email['body'][:200]}"
+            rag_results = self.rag_agent.query(query, n_results=3)
+            
+            if rag_results:
+                rag_context = "\n\n".join(rag_results)
+                base_context += f"\n\nAdditional Relevant Information:\n{rag_context}"
+        
         return base_context
\ No newline at end of file
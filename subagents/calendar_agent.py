@@ -1,113 +1,272 @@
-from subagents.base_agent import BaseAgent
-from calendar_handler import CalendarHandler
-from datetime import datetime, timedelta
-
-
-class CalendarAgent(BaseAgent):
-    """Subagent responsible for calendar operations"""
-    
-    def __init__(self, calendar_service):
-        super().__init__("CalendarAgent", "Calendar Management Specialist")
-        self.calendar = CalendarHandler(calendar_service)
-    
-    def process(self, task):
-        """Process calendar-related tasks"""
-        task_type = task.get('type')
-        
-        if task_type == 'schedule':
-            return self._schedule_meeting(task.get('meeting_info'))
-        elif task_type == 'check_upcoming':
-            return self._check_upcoming_events(task.get('hours', 24))
-        elif task_type == 'check_availability':
-            return self._check_availability(task.get('start_time'), task.get('end_time'))
-        else:
-            return {'error': f'Unknown task type: {task_type}'}
-    
-    def _schedule_meeting(self, meeting_info):
-        """Schedule a meeting"""
-        print(f"[{self.name}] Scheduling meeting: {meeting_info.get('title')}...")
-        
-        try:
-            date_str = meeting_info.get('date')
-            time_str = meeting_info.get('time')
-            duration = meeting_info.get('duration_minutes', 60)
-            
-            if not date_str or not time_str:
-                return self.report_to_coordinator({
-                    'scheduled': False,
-                    'error': 'Missing date or time information'
-                })
-            
-            # Parse datetime
-            try:
-                start_time = datetime.strptime(f"{date_str} {time_str}", "%Y-%m-%d %H:%M")
-            except ValueError as e:
-                return self.report_to_coordinator({
-                    'scheduled': False,
-                    'error': f'Invalid date/time format: {e}'
-                })
-            
-            end_time = start_time + timedelta(minutes=duration)
-            
-            print(f"[{self.name}] Start: {start_time}, End: {end_time}")
-            
-            # Check availability first
-            if not self.calendar.check_availability(start_time, end_time):
-                return self.report_to_coordinator({
-                    'scheduled': False,
-                    'reason': 'Time slot not available - you have a conflicting event',
-                    'meeting': meeting_info.get('title')
-                })
-            
-            # Create event
-            attendees = meeting_info.get('attendees', [])
-            location = meeting_info.get('location', 'TBD')
-            
-            event = self.calendar.create_event(
-                summary=meeting_info.get('title'),
-                start_time=start_time,
-                end_time=end_time,
-                attendees=attendees,
-                description=f"Location: {location}"
-            )
-            
-            if event:
-                print(f"[{self.name}] ✓ Meeting scheduled successfully!")
-                return self.report_to_coordinator({
-                    'scheduled': True,
-                    'event_id': event.get('id'),
-                    'meeting': meeting_info.get('title'),
-                    'start_time': start_time.isoformat(),
-                    'attendees': attendees
-                })
-            else:
-                return self.report_to_coordinator({
-                    'scheduled': False,
-                    'error': 'Failed to create calendar event'
-                })
-                
-        except Exception as e:
-            print(f"[{self.name}] Error: {e}")
-            return self.report_to_coordinator({
-                'scheduled': False,
-                'error': str(e)
-            })
-    
-    def _check_upcoming_events(self, hours):
-        """Get upcoming events"""
-        print(f"[{self.name}] Checking upcoming events for next {hours} hours...")
-        events = self.calendar.get_upcoming_events(hours=hours)
-        
-        return self.report_to_coordinator({
-            'events': events,
-            'count': len(events)
-        })
-    
-    def _check_availability(self, start_time, end_time):
-        """Check if time slot is available"""
-        available = self.calendar.check_availability(start_time, end_time)
-        return self.report_to_coordinator({
-            'available': available,
-            'start_time': start_time.isoformat(),
-            'end_time': end_time.isoformat()
-        })
+from subagents.base_agent import BaseAgent
+from calendar_handler import CalendarHandler
+from calendar_mirror import as_utc
+from datetime import datetime, timedelta
+import pytz
+from config import AVAILABILITY_MAX_DAYS, AVAILABILITY_MAX_SLOTS
+
+
+class CalendarAgent(BaseAgent):
+    """Subagent responsible for calendar operations"""
+    
+    def __init__(self, calendar_service):
+        super().__init__("CalendarAgent", "Calendar Management Specialist")
+        self.calendar = CalendarHandler(calendar_service)
+    
+    def process(self, task):
+        """Process calendar-related tasks"""
+        task_type = task.get('type')
+        
+        if task_type == 'schedule':
+            return self._schedule_meeting(task.get('meeting_info'))
+        elif task_type == 'schedule_batch':
+            return self._schedule_meetings(task.get('meetings', []))
+        elif task_type == 'check_upcoming':
+            return self._check_upcoming_events(task.get('hours', 24))
+        elif task_type == 'check_availability':
+            return self._check_availability(task.get('start_time'), task.get('end_time'))
+        elif task_type == 'find_free_slots':
+            return self._find_free_slots(
+                task.get('start_date'),
+                task.get('end_date'),
+                task.get('duration_minutes', 30),
+                task.get('work_start', '09:00'),
+                task.get('work_end', '17:00'),
+                task.get('attendees', []),
+                task.get('limit', 20),
+                task.get('timezone', 'UTC'),
+                task.get('step_minutes')
+            )
+        else:
+            return {'error': f'Unknown task type: {task_type}'}
+    
+    def _schedule_meeting(self, meeting_info):
+        """Schedule a meeting"""
+        print(f"[{self.name}] Scheduling meeting: {meeting_info.get('title')}...")
+        
+        try:
+            start_time, end_time, error = self._meeting_window(meeting_info)
+            if error:
+                return self.report_to_coordinator(error)
+            
+            # Check availability first
+            if not self.calendar.check_availability(start_time, end_time):
+                return self.report_to_coordinator(self._conflict(meeting_info))
+            
+            return self.report_to_coordinator(self._create_meeting(meeting_info, start_time, end_time))
+                
+        except Exception as e:
+            print(f"[{self.name}] Error: {e}")
+            return self.report_to_coordinator({
+                'scheduled': False,
+                'error': str(e)
+            })
+    
+    def _schedule_meetings(self, meetings):
+        """Schedule several meetings with one free/busy query for all of them"""
+        print(f"[{self.name}] Scheduling {len(meetings)} meetings...")
+        
+        results = [None] * len(meetings)
+        windows = []
+        for index, meeting_info in enumerate(meetings):
+            try:
+                start_time, end_time, error = self._meeting_window(meeting_info)
+            except Exception as e:
+                print(f"[{self.name}] Error: {e}")
+                start_time, end_time, error = None, None, {'scheduled': False, 'error': str(e)}
+            if error:
+                results[index] = dict(error, meeting=meeting_info.get('title'))
+            else:
+                windows.append((index, start_time, end_time))
+        
+        if windows:
+            try:
+                busy = self.calendar.get_busy_intervals(
+                    min(start for _, start, _ in windows),
+                    max(end for _, _, end in windows)
+                )
+            except Exception as e:
+                print(f"[{self.name}] Error querying free/busy: {e}")
+                busy = None
+            
+            for index, start_time, end_time in windows:
+                meeting_info = meetings[index]
+                try:
+                    if busy is None:
+                        available = self.calendar.check_availability(start_time, end_time)
+                    else:
+                        available = busy.is_free(as_utc(start_time), as_utc(end_time))
+                    
+                    if not available:
+                        results[index] = self._conflict(meeting_info)
+                        continue
+                    
+                    results[index] = self._create_meeting(meeting_info, start_time, end_time)
+                    if results[index]['scheduled'] and busy is not None:
+                        # Later meetings in the batch must not double-book this slot
+                        busy.add(as_utc(start_time), as_utc(end_time))
+                except Exception as e:
+                    print(f"[{self.name}] Error: {e}")
+                    results[index] = {'scheduled': False, 'error': str(e), 'meeting': meeting_info.get('title')}
+        
+        return self.report_to_coordinator({
+            'results': results,
+            'scheduled': sum(1 for result in results if result['scheduled']),
+            'count': len(results)
+        })
+    
+    def _meeting_window(self, meeting_info):
+        """Parse a meeting's start and end, returning (start, end, error)"""
+        date_str = meeting_info.get('date')
+        time_str = meeting_info.get('time')
+        duration = meeting_info.get('duration_minutes', 60)
+        
+        if not date_str or not time_str:
+            return None, None, {
+                'scheduled': False,
+                'error': 'Missing date or time information'
+            }
+        
+        # Parse datetime
+        try:
+            start_time = datetime.strptime(f"{date_str} {time_str}", "%Y-%m-%d %H:%M")
+        except (TypeError, ValueError) as e:
+            return None, None, {
+                'scheduled': False,
+                'error': f'Invalid date/time format: {e}'
+            }
+        
+        # The duration comes from the LLM and may be null, a string or nonsense
+        try:
+            duration = int(duration if duration is not None else 60)
+        except (TypeError, ValueError):
+            duration = 0
+        if duration <= 0:
+            return None, None, {
+                'scheduled': False,
+                'error': f"Invalid meeting duration: {meeting_info.get('duration_minutes')!r}"
+            }
+        
+        end_time = start_time + timedelta(minutes=duration)
+        
+        print(f"[{self.name}] Start: {start_time}, End: {end_time}")
+        return start_time, end_time, None
+    
+    def _conflict(self, meeting_info):
+        return {
+            'scheduled': False,
+            'reason': 'Time slot not available - you have a conflicting event',
+            'meeting': meeting_info.get('title')
+        }
+    
+    def _create_meeting(self, meeting_info, start_time, end_time):
+        """Create the calendar event for a meeting whose slot is known to be free"""
+        attendees = meeting_info.get('attendees', [])
+        location = meeting_info.get('location', 'TBD')
+        
+        event = self.calendar.create_event(
+            summary=meeting_info.get('title'),
+            start_time=start_time,
+            end_time=end_time,
+            attendees=attendees,
+            description=f"Location: {location}"
+        )
+        
+        if event:
+            print(f"[{self.name}] ✓ Meeting scheduled successfully!")
+            return {
+                'scheduled': True,
+                'event_id': event.get('id'),
+                'meeting': meeting_info.get('title'),
+                'start_time': start_time.isoformat(),
+                'attendees': attendees
+            }
+        else:
+            return {
+                'scheduled': False,
+                'error': 'Failed to create calendar event'
+            }
+    
+    def _check_upcoming_events(self, hours):
+        """Get upcoming events"""
+        print(f"[{self.name}] Checking upcoming events for next {hours} hours...")
+        events = self.calendar.get_upcoming_events(hours=hours)
+        
+        return self.report_to_coordinator({
+            'events': events,
+            'count': len(events)
+        })
+    
+    def _check_availability(self, start_time, end_time):
+        """Check if time slot is available"""
+        available = self.calendar.check_availability(start_time, end_time)
+        return self.report_to_coordinator({
+            'available': available,
+            'start_time': start_time.isoformat(),
+            'end_time': end_time.isoformat()
+        })
+    
+    def _find_free_slots(self, start_date, end_date, duration_minutes, work_start, work_end,
+                         attendees, limit, timezone_name, step_minutes=None):
+        """First `limit` free slots within working hours between two dates (inclusive)"""
+        # These come straight from query parameters; bad values are reported, not raised
+        try:
+            tz = pytz.timezone(timezone_name)
+        except pytz.UnknownTimeZoneError:
+            return self.report_to_coordinator({'error': f'Unknown timezone: {timezone_name}'})
+        
+        try:
+            first_day = datetime.strptime(start_date, "%Y-%m-%d").date()
+            last_day = datetime.strptime(end_date or start_date, "%Y-%m-%d").date()
+            day_start = datetime.strptime(work_start, "%H:%M").time()
+            day_end = datetime.strptime(work_end, "%H:%M").time()
+        except (TypeError, ValueError) as e:
+            return self.report_to_coordinator({'error': f'Invalid date/time format: {e}'})
+        
+        if last_day < first_day:
+            return self.report_to_coordinator({'error': f'End date {end_date} is before start date {start_date}'})
+        # Every day and attendee adds free/busy data to fetch and cache
+        if (last_day - first_day).days + 1 > AVAILABILITY_MAX_DAYS:
+            return self.report_to_coordinator({'error': f'Date range is longer than {AVAILABILITY_MAX_DAYS} days'})
+        if limit > AVAILABILITY_MAX_SLOTS:
+            return self.report_to_coordinator({'error': f'Limit is more than {AVAILABILITY_MAX_SLOTS} slots'})
+        if day_end <= day_start:
+            return self.report_to_coordinator({'error': f'Working hours end ({work_end}) before they start ({work_start})'})
+        if duration_minutes <= 0 or (step_minutes is not None and step_minutes <= 0) or limit <= 0:
+            return self.report_to_coordinator({'error': 'Duration, step and limit must be positive'})
+        
+        duration = timedelta(minutes=duration_minutes)
+        step = timedelta(minutes=step_minutes) if step_minutes else duration
+        
+        # Working-hour windows per day, converted to UTC
+        windows = []
+        day = first_day
+        while day <= last_day:
+            windows.append((
+                tz.localize(datetime.combine(day, day_start)).astimezone(pytz.utc),
+                tz.localize(datetime.combine(day, day_end)).astimezone(pytz.utc)
+            ))
+            day += timedelta(days=1)
+        
+        busy = self.calendar.get_busy_intervals_cached(
+            windows[0][0],
+            windows[-1][1],
+            ['primary'] + list(attendees)
+        )
+        
+        slots = []
+        for window_start, window_end in windows:
+            for slot_start, slot_end in busy.free_slots_between(window_start, window_end, duration, step,
+                                                                limit - len(slots)):
+                slots.append({
+                    'start': slot_start.astimezone(tz).isoformat(),
+                    'end': slot_end.astimezone(tz).isoformat()
+                })
+            if len(slots) >= limit:
+                break
+        
+        return self.report_to_coordinator({
+            'slots': slots,
+            'count': len(slots),
+            'timezone': timezone_name
+        })
@@ -1,119 +1,403 @@
-from subagents.base_agent import BaseAgent
-from gmail_handler import GmailHandler
-import json
-
-
-class EmailAgent(BaseAgent):
-    """Subagent responsible for email operations"""
-    
-    def __init__(self, gmail_service):
-        super().__init__("EmailAgent", "Email Management Specialist")
-        self.gmail = GmailHandler(gmail_service)
-    
-    def process(self, task):
-        """Process email-related tasks"""
-        task_type = task.get('type')
-        
-        if task_type == 'summarize':
-            return self._summarize_emails(task.get('max_emails', 10))
-        elif task_type == 'extract_meetings':
-            return self._extract_meeting_requests(task.get('emails', []))
-        elif task_type == 'send':
-            return self._send_email(task.get('to'), task.get('subject'), task.get('body'))
-        else:
-            return {'error': f'Unknown task type: {task_type}'}
-    
-    def _summarize_emails(self, max_emails):
-        """Fetch and summarize unread emails"""
-        print(f"[{self.name}] Fetching unread emails...")
-        emails = self.gmail.get_unread_emails(max_results=max_emails)
-        
-        if not emails:
-            return self.report_to_coordinator({
-                'summary': 'No unread emails',
-                'count': 0,
-                'emails': []
-            })
-        
-        # Use Gemini to summarize
-        email_texts = []
-        for email in emails:
-            email_texts.append(
-                f"From: {email['sender']}\n"
-                f"Subject: {email['subject']}\n"
-                f"Body: {email['body'][:300]}..."
-            )
-        
-        prompt = f"""You are an email assistant. Summarize these {len(emails)} emails concisely.
-Highlight important emails and action items.
-
-Emails:
-{chr(10).join(email_texts)}
-
-Provide a brief, actionable summary."""
-        
-        try:
-            summary = self.generate_with_retry(prompt)
-        except Exception as e:
-            summary = f"Error generating summary: {e}"
-        
-        return self.report_to_coordinator({
-            'summary': summary,
-            'count': len(emails),
-            'emails': emails
-        })
-    
-    def _extract_meeting_requests(self, emails):
-        """Extract meeting information from emails"""
-        print(f"[{self.name}] Analyzing emails for meeting requests...")
-        meeting_requests = []
-        
-        for email in emails:
-            prompt = f"""Analyze this email for meeting requests.
-
-Subject: {email['subject']}
-Body: {email['body']}
-
-If this contains a meeting request, respond with JSON:
-{{
-    "is_meeting": true,
-    "title": "meeting title",
-    "date": "YYYY-MM-DD",
-    "time": "HH:MM",
-    "duration_minutes": 60,
-    "attendees": ["email@example.com"],
-    "location": "location or online"
-}}
-
-If no meeting request, respond: {{"is_meeting": false}}"""
-            
-            try:
-                result_text = self.generate_with_retry(prompt)
-                
-                # Extract JSON from response
-                import re
-                json_match = re.search(r'\{.*\}', result_text, re.DOTALL)
-                if json_match:
-                    meeting_info = json.loads(json_match.group())
-                    if meeting_info.get('is_meeting'):
-                        meeting_info['email_id'] = email['id']
-                        meeting_info['email_subject'] = email['subject']
-                        meeting_requests.append(meeting_info)
-            except Exception as e:
-                print(f"Error parsing email {email['id']}: {e}")
-        
-        return self.report_to_coordinator({
-            'meeting_requests': meeting_requests,
-            'count': len(meeting_requests)
-        })
-    
-    def _send_email(self, to, subject, body):
-        """Send an email"""
-        print(f"[{self.name}] Sending email to {to}...")
-        self.gmail.send_email(to, subject, body)
-        return self.report_to_coordinator({'sent': True, 'to': to})
-    
-    def mark_emails_processed(self, email_ids):
-        """Mark emails as read"""
-        for email_id in email_ids:
-            self.gmail.mark_as_read(email_id)
+from subagents.base_agent import BaseAgent
+from gmail_handler import GmailHandler
+from meeting_classifier import MeetingClassifier
+from config import (
+    MEETING_EXTRACTION_TOKEN_BUDGET, MEETING_EXTRACTION_MAX_BATCH,
+    PROMPT_SUMMARY_TOKEN_BUDGET, PROMPT_SUMMARY_EMAIL_TOKENS, PROMPT_EMAIL_MAX_TOKENS
+)
+from llm_gateway import estimate_tokens
+from prompt_compactor import compact_emails
+from email.utils import parseaddr
+import json
+import re
+import time
+
+
+# '<email_id> | <summary>' lines returned by the mini-summary prompt
+MINI_SUMMARY_LINE = re.compile(r"^\s*[-*•]?\s*`?([^\s|`]+)`?\s*\|\s*(.+)$")
+ACTION_BULLET = '• [Action] '
+
+# Message store meta key of the precomputed inbox digest
+DIGEST_KEY = 'inbox_digest'
+
+
+class EmailAgent(BaseAgent):
+    """Subagent responsible for email operations"""
+    
+    def __init__(self, gmail_service):
+        super().__init__("EmailAgent", "Email Management Specialist")
+        self.gmail = GmailHandler(gmail_service)
+        self.meeting_classifier = MeetingClassifier()
+    
+    def process(self, task):
+        """Process email-related tasks"""
+        task_type = task.get('type')
+        
+        if task_type == 'summarize':
+            return self._summarize_emails(task.get('max_emails', 10), task.get('emails'))
+        elif task_type == 'refresh_digest':
+            return self._refresh_digest(task.get('max_emails', 10))
+        elif task_type == 'fetch_new':
+            return self._fetch_new_emails(task.get('max_emails'))
+        elif task_type == 'extract_meetings':
+            return self._extract_meeting_requests(task.get('emails', []))
+        elif task_type == 'send':
+            return self._send_email(task.get('to'), task.get('subject'), task.get('body'))
+        else:
+            return {'error': f'Unknown task type: {task_type}'}
+    
+    def _fetch_new_emails(self, max_emails=None):
+        """Fetch only the unread emails that arrived since the last check"""
+        print(f"[{self.name}] Syncing mailbox changes...")
+        try:
+            emails = self.gmail.get_new_emails(max_results=max_emails)
+            unread_count = self.gmail.mailbox_sync.unread_count()
+        except Exception as e:
+            print(f"[{self.name}] Error syncing mailbox: {e}")
+            emails, unread_count = [], 0
+        
+        return self.report_to_coordinator({
+            'emails': emails,
+            'count': len(emails),
+            'unread_count': unread_count,
+            'fetch_errors': self.gmail.last_fetch_errors
+        })
+    
+    def _summarize_emails(self, max_emails, emails=None):
+        """Summarize the given emails, or fetch and summarize unread emails"""
+        fetched = emails is None
+        if fetched:
+            print(f"[{self.name}] Fetching unread emails...")
+            emails = self.gmail.get_unread_emails(max_results=max_emails)
+        
+        if not emails:
+            return self.report_to_coordinator({
+                'summary': 'No unread emails',
+                'count': 0,
+                'emails': [],
+                'fetch_errors': self.gmail.last_fetch_errors
+            })
+        
+        # Only emails without a stored mini-summary cost a Gemini call
+        summaries = self.gmail.store.mini_summaries([email['id'] for email in emails])
+        new_emails = [email for email in emails if email['id'] not in summaries]
+        if new_emails:
+            print(f"[{self.name}] Summarizing {len(new_emails)} new of {len(emails)} emails...")
+            try:
+                result_text = self.generate_with_retry(self._mini_summary_prompt(new_emails))
+                found = self._parse_mini_summaries(result_text, {email['id'] for email in new_emails})
+            except Exception as e:
+                print(f"[{self.name}] Error summarizing new emails: {e}")
+                found = {}
+            self._save_mini_summaries(found)
+            summaries.update(found)
+        if fetched:
+            self._evict_read_summaries(emails)
+        
+        return self.report_to_coordinator({
+            'summary': self._digest(emails, summaries),
+            'count': len(emails),
+            'emails': emails,
+            'fetch_errors': self.gmail.last_fetch_errors
+        })
+    
+    def _refresh_digest(self, max_emails):
+        """Summarize the unread emails and publish the digest for chat to serve"""
+        result = self._summarize_emails(max_emails)['result']
+        digest = self._publish_digest(result['summary'], result['count'])
+        return self.report_to_coordinator(dict(digest, fetch_errors=result['fetch_errors']))
+    
+    def get_digest(self):
+        """Latest published inbox digest ({'summary', 'count', 'generated_at'}), or None"""
+        return self.gmail.store.get_meta(DIGEST_KEY)
+    
+    def _publish_digest(self, summary, count):
+        digest = {'summary': summary, 'count': count, 'generated_at': time.time()}
+        self.gmail.store.put_meta(DIGEST_KEY, digest)
+        return digest
+    
+    def stream_summary(self, max_emails=10):
+        """Fetch unread emails and return (count, generator of digest text chunks)"""
+        print(f"[{self.name}] Fetching unread emails...")
+        emails = self.gmail.get_unread_emails(max_results=max_emails)
+        if not emails:
+            return 0, iter(())
+        return len(emails), self._stream_summary_chunks(emails)
+    
+    def _stream_summary_chunks(self, emails):
+        # Stored mini-summaries are sent at once; new ones are sent line by line as Gemini writes them
+        summaries = self.gmail.store.mini_summaries([email['id'] for email in emails])
+        by_id = {email['id']: email for email in emails}
+        new_emails = [email for email in emails if email['id'] not in summaries]
+        for email in emails:
+            if email['id'] in summaries:
+                yield self._digest_line(email, summaries[email['id']]) + '\n'
+        
+        found = {}
+        if new_emails:
+            wanted = {email['id'] for email in new_emails}
+            buffer = ''
+            try:
+                for chunk in self.gateway.stream(self._mini_summary_prompt(new_emails), self.model_name,
+                                                 self.generation_config):
+                    buffer += chunk
+                    lines, buffer = buffer.rsplit('\n', 1) if '\n' in buffer else ('', buffer)
+                    for msg_id, summary in self._parse_mini_summaries(lines, wanted - found.keys()).items():
+                        found[msg_id] = summary
+                        yield self._digest_line(by_id[msg_id], summary) + '\n'
+                for msg_id, summary in self._parse_mini_summaries(buffer, wanted - found.keys()).items():
+                    found[msg_id] = summary
+                    yield self._digest_line(by_id[msg_id], summary) + '\n'
+            except Exception as e:
+                print(f"[{self.name}] Error summarizing new emails: {e}")
+            self._save_mini_summaries(found)
+            
+            for email in new_emails:
+                if email['id'] not in found:
+                    yield self._digest_line(email, None) + '\n'
+        self._evict_read_summaries(emails)
+        summaries.update(found)
+        self._publish_digest(self._digest(emails, summaries), len(emails))
+    
+    def _mini_summary_prompt(self, emails):
+        # Gmail's snippet is enough for a summary, so bodies are not fetched
+        previews, stats = compact_emails(
+            [email.get('snippet') or email['body'][:300] for email in emails],
+            PROMPT_SUMMARY_TOKEN_BUDGET,
+            per_email_tokens=PROMPT_SUMMARY_EMAIL_TOKENS
+        )
+        self._log_compaction(stats)
+        email_texts = []
+        for email, preview in zip(emails, previews):
+            email_texts.append(
+                f"email_id: {email['id']}\n"
+                f"From: {email['sender']}\n"
+                f"Subject: {email['subject']}\n"
+                f"Body: {preview}"
+            )
+        
+        return f"""You are an email assistant. Summarize each of these {len(emails)} emails in one short sentence (at most 20 words).
+Start the sentence with "ACTION:" if the email needs a reply or action from me.
+
+Emails:
+{(chr(10) * 2).join(email_texts)}
+
+Respond with exactly one line per email and nothing else, in this format:
+<email_id> | <summary>"""
+    
+    def _parse_mini_summaries(self, text, wanted):
+        """{email_id: summary} for the '<email_id> | <summary>' lines of wanted emails"""
+        summaries = {}
+        for line in text.splitlines():
+            match = MINI_SUMMARY_LINE.match(line)
+            if match and match.group(1) in wanted:
+                summaries[match.group(1)] = match.group(2).strip()
+        return summaries
+    
+    def _save_mini_summaries(self, summaries):
+        if summaries:
+            self.gmail.store.set_mini_summaries(summaries)
+            self.gmail.store.mark(list(summaries), 'summarized')
+    
+    def _evict_read_summaries(self, emails):
+        # Anything no longer unread will not appear in a digest again
+        keep = set(self.gmail.mailbox_sync.unread_ids) | {email['id'] for email in emails}
+        evicted = self.gmail.store.evict_mini_summaries(keep)
+        if evicted:
+            print(f"[{self.name}] Dropped {evicted} summaries of emails that have been read")
+    
+    def _digest(self, emails, summaries):
+        """Inbox digest from per-email summaries, emails that need action first"""
+        lines = [self._digest_line(email, summaries.get(email['id'])) for email in emails]
+        return '\n'.join(sorted(lines, key=lambda line: not line.startswith(ACTION_BULLET)))
+    
+    def _digest_line(self, email, summary):
+        sender = parseaddr(email['sender'])[0] or email['sender']
+        if summary is None:
+            # No summary could be generated - fall back to Gmail's snippet
+            snippet = (email.get('snippet') or '')[:100]
+            return f"• {sender} — {email['subject']}" + (f": {snippet}" if snippet else '')
+        if summary.upper().startswith('ACTION:'):
+            return f"{ACTION_BULLET}{sender} — {email['subject']}: {summary[7:].strip()}"
+        return f"• {sender} — {email['subject']}: {summary}"
+    
+    def _extract_meeting_requests(self, emails):
+        """Extract meeting information from emails"""
+        print(f"[{self.name}] Analyzing emails for meeting requests...")
+        meeting_requests = []
+        
+        # Emails whose meetings were already extracted (e.g. before a restart) are skipped
+        done = self.gmail.store.marked([email['id'] for email in emails], 'meetings_extracted')
+        pending = [email for email in emails if email['id'] not in done]
+        self.gmail.load_bodies(pending)
+        
+        # Emails with no date, time, meeting vocabulary or calendar invite never reach the LLM
+        candidates, audited, skipped = self.meeting_classifier.split(pending)
+        self.gmail.store.mark([email['id'] for email in skipped], 'meetings_extracted')
+        print(f"[{self.name}] Pre-filter: {len(candidates)}/{len(pending)} emails have meeting signals, "
+              f"{len(skipped)} skipped, {len(audited)} sampled for audit")
+        audited_ids = {email['id'] for email in audited}
+        pending = candidates + audited
+        
+        # Quoted history, signatures and repeated thread text are dropped before packing
+        compacted, stats = compact_emails(
+            [email['body'] for email in pending],
+            PROMPT_EMAIL_MAX_TOKENS * len(pending),
+            per_email_tokens=PROMPT_EMAIL_MAX_TOKENS
+        )
+        self._log_compaction(stats)
+        bodies = {email['id']: body for email, body in zip(pending, compacted)}
+        
+        # Several emails share one prompt; a batch that cannot be parsed is retried one email at a time
+        for batch in self._pack_extraction_batches(pending, bodies):
+            results = self._extract_batch(batch, bodies) if len(batch) > 1 else None
+            if results is None:
+                results = {}
+                for email in batch:
+                    info = self._extract_single(email, bodies[email['id']])
+                    if info is not None:
+                        results[email['id']] = info
+            
+            for email in batch:
+                if email['id'] not in results:
+                    continue
+                meeting_info = results[email['id']]
+                if email['id'] in audited_ids:
+                    self.meeting_classifier.record_audit(meeting_info.get('is_meeting'))
+                if meeting_info.get('is_meeting'):
+                    meeting_info['email_id'] = email['id']
+                    meeting_info['email_subject'] = email['subject']
+                    meeting_requests.append(meeting_info)
+                self.gmail.store.mark([email['id']], 'meetings_extracted')
+        
+        return self.report_to_coordinator({
+            'meeting_requests': meeting_requests,
+            'count': len(meeting_requests),
+            'skipped': len(skipped),
+            'prefilter': self.meeting_classifier.get_stats()
+        })
+    
+    def _pack_extraction_batches(self, emails, bodies):
+        """Group emails into batches that fit the extraction token budget"""
+        batches = []
+        batch, batch_tokens = [], 0
+        for email in emails:
+            tokens = estimate_tokens(email['subject']) + estimate_tokens(bodies[email['id']])
+            if batch and (batch_tokens + tokens > MEETING_EXTRACTION_TOKEN_BUDGET
+                          or len(batch) >= MEETING_EXTRACTION_MAX_BATCH):
+                batches.append(batch)
+                batch, batch_tokens = [], 0
+            batch.append(email)
+            batch_tokens += tokens
+        if batch:
+            batches.append(batch)
+        return batches
+    
+    def _extract_batch(self, emails, bodies):
+        """Extract meetings from several emails in one prompt, or None if the response is unusable"""
+        email_blocks = "\n\n".join(
+            f"--- email_id: {email['id']} ---\nSubject: {email['subject']}\nBody: {bodies[email['id']]}"
+            for email in emails
+        )
+        prompt = f"""Analyze each of these {len(emails)} emails for meeting requests.
+
+{email_blocks}
+
+Respond with a JSON array containing exactly one object per email, in any order:
+[
+    {{
+        "email_id": "the email_id above",
+        "is_meeting": true,
+        "title": "meeting title",
+        "date": "YYYY-MM-DD",
+        "time": "HH:MM",
+        "duration_minutes": 60,
+        "attendees": ["email@example.com"],
+        "location": "location or online"
+    }}
+]
+
+For an email with no meeting request use {{"email_id": "...", "is_meeting": false}}"""
+        
+        try:
+            result_text = self.generate_with_retry(prompt)
+            json_match = re.search(r'\[.*\]', result_text, re.DOTALL)
+            records = json.loads(json_match.group()) if json_match else None
+        except Exception as e:
+            print(f"[{self.name}] Batched extraction failed: {e}")
+            return None
+        
+        if not isinstance(records, list):
+            print(f"[{self.name}] Batched extraction returned no JSON array, falling back to per-email prompts")
+            return None
+        
+        wanted = {email['id'] for email in emails}
+        results = {}
+        for record in records:
+            if isinstance(record, dict) and str(record.get('email_id')) in wanted:
+                results[str(record.pop('email_id'))] = record
+        if len(results) != len(wanted):
+            print(f"[{self.name}] Batched extraction covered {len(results)}/{len(wanted)} emails, "
+                  f"falling back to per-email prompts")
+            return None
+        
+        print(f"[{self.name}] Extracted {len(emails)} emails in one request")
+        return results
+    
+    def _extract_single(self, email, body):
+        """Extract meeting information from one email, or None if the request fails"""
+        prompt = f"""Analyze this email for meeting requests.
+
+Subject: {email['subject']}
+Body: {body}
+
+If this contains a meeting request, respond with JSON:
+{{
+    "is_meeting": true,
+    "title": "meeting title",
+    "date": "YYYY-MM-DD",
+    "time": "HH:MM",
+    "duration_minutes": 60,
+    "attendees": ["email@example.com"],
+    "location": "location or online"
+}}
+
+If no meeting request, respond: {{"is_meeting": false}}"""
+        
+        try:
+            result_text = self.generate_with_retry(prompt)
+            
+            # Extract JSON from response
+            json_match = re.search(r'\{.*\}', result_text, re.DOTALL)
+            if json_match:
+                return json.loads(json_match.group())
+            return {'is_meeting': False}
+        except Exception as e:
+            print(f"Error parsing email {email['id']}: {e}")
+            return None
+    
+    def _log_compaction(self, stats):
+        if stats['tokens_saved'] or stats['emails_dropped']:
+            print(f"[{self.name}] Compacted prompt: {stats['tokens_before']} -> {stats['tokens_after']} tokens "
+                  f"({stats['tokens_saved']} saved, {stats['emails_dropped']} emails dropped)")
+    
+    def _send_email(self, to, subject, body):
+        """Queue an email for delivery by the background outbox sender"""
+        if not to:
+            return self.report_to_coordinator({'queued': False, 'error': 'Missing recipient'})
+        
+        print(f"[{self.name}] Queueing email to {to}...")
+        try:
+            outbox_id = self.gmail.queue_email(to, subject, body)
+        except Exception as e:
+            print(f"[{self.name}] Error queueing email: {e}")
+            return self.report_to_coordinator({'queued': False, 'error': str(e)})
+        
+        return self.report_to_coordinator({'queued': True, 'outbox_id': outbox_id, 'to': to})
+    
+    def mark_emails_processed(self, email_ids, defer=False):
+        """Mark emails as read, or queue them for the end-of-cycle flush"""
+        if defer:
+            self.gmail.defer_mark_as_read(email_ids)
+        else:
+            self.gmail.mark_as_read(email_ids)
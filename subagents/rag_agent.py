@@ -1,12 +1,19 @@
-import chromadb
-from sentence_transformers import SentenceTransformer
+from rag_resources import get_rag_resources
 
 class RAGAgent:
-    def __init__(self):
+    def __init__(self, collection_name="resume_kb"):
         # Use sentence-transformers for local embeddings (no API quota limits)
-        self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-        self.client = chromadb.PersistentClient(path="./rag_db")
-        self.collection = self.client.get_or_create_collection("resume_kb")
+        # The model and vector store are shared by all agents and loaded on first use
+        self.resources = get_rag_resources()
+        self.collection_name = collection_name
+    
+    @property
+    def embedding_model(self):
+        return self.resources.embedding_model()
+    
+    @property
+    def collection(self):
+        return self.resources.collection(self.collection_name)
     
     def add_document(self, text, metadata):
         """Add document to RAG"""
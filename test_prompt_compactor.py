@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Checks that prompt compaction strips footers without losing the request itself
+"""
+
+from prompt_compactor import compact_text
+
+
+def test_sentences_mentioning_footer_words_survive():
+    body = (
+        "Can we meet Tuesday at 3pm? This is confidential, please don't forward.\n"
+        "The draft covers our privacy policy rewrite - I'd like to unsubscribe from the old vendor.\n"
+        "© notes are in the shared doc."
+    )
+    assert compact_text(body) == body
+    
+    body = "Hi Carlo,\n\nCan we meet Tuesday at 3pm? This is confidential, please don't forward."
+    assert compact_text(body) == body
+
+
+def test_trailing_footer_notices_are_stripped():
+    body = (
+        "Hi Carlo,\n\n"
+        "Could you send me your resume for the backend role?\n\n"
+        "Thanks,\nJane\n\n"
+        "CONFIDENTIALITY NOTICE: This email and any attachments are confidential and intended "
+        "solely for the named recipient. If you have received this email in error, please delete it.\n\n"
+        "Unsubscribe | Privacy Policy\n"
+        "© 2025 Acme Inc. All rights reserved."
+    )
+    compacted = compact_text(body)
+    assert "Could you send me your resume for the backend role?" in compacted
+    assert "CONFIDENTIALITY" not in compacted
+    assert "Unsubscribe" not in compacted
+    assert "All rights reserved" not in compacted
+
+
+def test_standalone_footer_link_lines_are_stripped():
+    body = "View in browser\n\nYour weekly summary is ready.\n\nUnsubscribe | Privacy Policy | Terms of Service"
+    assert compact_text(body) == "Your weekly summary is ready."
+
+
+if __name__ == "__main__":
+    test_sentences_mentioning_footer_words_survive()
+    test_trailing_footer_notices_are_stripped()
+    test_standalone_footer_link_lines_are_stripped()
+    print("✓ All prompt compaction checks passed")